@@ -1,14 +1,20 @@
 """
 All tournament interactions.
 """
+import csv
+from datetime import datetime
 from decimal import Decimal as Dec
-from flask import Blueprint, g, request
+from io import BytesIO
+import json
+import re
+
+from flask import Blueprint, g, request, Response, stream_with_context
 
 from controllers.request_helpers import enforce_request_variables, \
 json_response, requires_auth, text_response, ensure_permission
 from models.dao.registration import TournamentRegistration
-from models.dao.tournament import Tournament as TournamentDAO
-from models.tournament import Tournament
+from models.tournament import RESULT_FIELDS, Tournament, \
+list_tournaments as list_all_tournaments
 
 TOURNAMENT = Blueprint('TOURNAMENT', __name__)
 
@@ -73,18 +79,45 @@ def list_tournaments():
     GET a list of tournaments
     Returns json. The only key is 'tournaments' and the value is a list of
     dicts - {name: '', date, 'YY-MM-DD', rounds: 1}
+
+    Optional query parameters:
+        - from_date, to_date - YYYY-MM-DD. Only tournaments on or between them
+        - order - name (the default) or date, i.e. date then name
+        - limit - the most tournaments to return
+        - after_name, after_date - the name, and date when ordered by date, of
+            the last tournament of the previous page
     """
     user = getattr(request.authorization, 'username', None)
-    # pylint: disable=no-member
-    details = [{
-        'name': x.name,
-        'date': x.date,
-        'rounds': x.rounds.count(),
-        'entries': x.entries.count(),
-        'user_entered': x.entries.filter_by(player_id=user).count() == 1
-    } for x in TournamentDAO.query.all()]
+    order = request.args.get('order', 'name')
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 0:
+        raise ValueError('limit cannot be negative')
+
+    after = None
+    if 'after_name' in request.args:
+        after = [request.args['after_name']]
+        if order == 'date':
+            if 'after_date' not in request.args:
+                raise ValueError('after_date is needed to page by date')
+            after.insert(0, _parse_date('after_date'))
 
-    return {'tournaments' : sorted(details, key=lambda to: to['name'])}
+    return {'tournaments': list_all_tournaments(
+        username=user,
+        from_date=_parse_date('from_date'),
+        to_date=_parse_date('to_date'),
+        order=order,
+        after=after,
+        limit=limit)}
+
+def _parse_date(arg):
+    """Get the date in request arg, if there is one"""
+    value = request.args.get(arg)
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, Tournament.DATE_FORMAT).date()
+    except ValueError:
+        raise ValueError('Enter a valid {}: YYYY-MM-DD'.format(arg))
 
 @TOURNAMENT.route('/<tournament_id>/rankings', methods=['GET'])
 @json_response
@@ -103,7 +136,31 @@ def rank_entries():
             'ranking': 3
         },
     ]
+
+    Optional query parameters:
+        - top - only the first top entries
+        - offset, limit - a page of the ranking
+    Rankings are for the whole tournament and ties are ordered by entry id so
+    pages are consistent.
     """
+    top = request.args.get('top', type=int)
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if any(x < 0 for x in [top, offset, limit] if x is not None):
+        raise ValueError('top, offset and limit cannot be negative')
+
+    end = None if limit is None else offset + limit
+    if top is not None:
+        end = top if end is None else min(end, top)
+
+    strategy = g.tournament.ranking_strategy
+    entries = g.tournament.get_entries(score_info=False)
+    if end is None:
+        entries = strategy.overall_ranking(entries)
+    else:
+        entries = strategy.top_ranking(entries, end)
+    entries = entries[offset:end]
+    g.tournament.add_score_info(entries)
 
     return [
         {
@@ -113,10 +170,55 @@ def rank_entries():
             'scores' : x.score_info,
             'total_score' : str(Dec(x.total_score).quantize(Dec('1.00'))),
             'ranking': x.ranking
-        } for x in g.tournament.ranking_strategy.overall_ranking(
-            g.tournament.get_entries())
+        } for x in entries
     ]
 
+@TOURNAMENT.route('/<tournament_id>/export', methods=['GET'])
+def export_results():
+    """
+    GET every entry, game, opponent, table and score in a tournament. The rows
+    are streamed as they are read from the db.
+
+    Optional query parameters:
+        - format - csv (the default) or jsonl for JSON Lines
+    """
+    fmt = request.args.get('format', 'csv')
+    rows = g.tournament.export_results()
+
+    if fmt == 'jsonl':
+        lines = (json.dumps(x) + '\n' for x in rows)
+        mimetype = 'application/x-ndjson'
+    elif fmt == 'csv':
+        lines = _csv_lines(rows)
+        mimetype = 'text/csv'
+    else:
+        raise ValueError('Unknown export format: {}'.format(fmt))
+
+    return Response(
+        stream_with_context(lines), mimetype=mimetype,
+        headers={'Content-Disposition': 'attachment; filename="{}.{}"'.\
+            format(_safe_filename(g.tournament_id), fmt)})
+
+def _safe_filename(name):
+    """
+    The name with anything but letters, digits, '-', '_' and '.' replaced by
+    '_' so it can be put in a header
+    """
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+def _csv_lines(rows):
+    """Format the dicts in rows as CSV, with a header, a line at a time"""
+    yield _csv_line(RESULT_FIELDS)
+    for row in rows:
+        yield _csv_line([row[x] for x in RESULT_FIELDS])
+
+def _csv_line(values):
+    """Format a list of values as a line of CSV"""
+    buf = BytesIO()
+    csv.writer(buf).writerow([
+        x.encode('utf-8') if isinstance(x, unicode) else x for x in values])
+    return buf.getvalue()
+
 @TOURNAMENT.route('/<tournament_id>/register/<username>', methods=['POST'])
 @requires_auth
 @ensure_permission({'permission': 'MODIFY_APPLICATION'})
@@ -24,16 +24,12 @@ def get_round_info(round_id):
     no_draw = AttributeError('No draw is available')
     rnd = g.tournament.get_round(round_id)
 
-    if rnd.draw is None:
+    draw_info = rnd.get_draw()
+
+    # Only a round that has never been drawn is drawn here
+    if not draw_info:
         rnd.make_draw(g.tournament.get_entries())
-        if rnd.draw is None:
-            raise no_draw
-
-    draw_info = [
-        {'table_number': t.table_number,
-         'entrants': [x if isinstance(x, str) else x.player_id \
-                      for x in t.entrants]
-        } for t in rnd.draw]
+        draw_info = rnd.get_draw()
 
     if not draw_info and rnd.get_dao().mission is None:
         raise no_draw
@@ -201,3 +201,30 @@ class TournamentScore(db.Model):
             self.entry_id,
             self.tournament_id,
             self.score_id)
+
+class Standing(db.Model):
+    """The running total of an entry's scores in a ScoreCategory"""
+    __tablename__ = 'standing'
+    entry_id = db.Column(db.Integer, db.ForeignKey(TournamentEntry.id),
+                         primary_key=True)
+    score_category_id = db.Column(db.Integer,
+                                  db.ForeignKey(ScoreCategory.id),
+                                  primary_key=True)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    num_scores = db.Column(db.Integer, nullable=False, default=0)
+
+    entry = db.relationship(TournamentEntry, \
+        backref=db.backref('standings', lazy='dynamic'))
+    score_category = db.relationship(ScoreCategory, \
+        backref=db.backref('standings', lazy='dynamic'))
+
+    def __init__(self, entry_id, score_category_id, score=0, num_scores=0):
+        self.entry_id = entry_id
+        self.score_category_id = score_category_id
+        self.score = score
+        self.num_scores = num_scores
+
+    def __repr__(self):
+        return '<Standing (entry: {}, category: {}, {} from {} scores)>'.\
+            format(self.entry_id, self.score_category_id, self.score,
+                   self.num_scores)
@@ -22,6 +22,7 @@ class Tournament(db.Model):
         db.ForeignKey(Account.username),
         nullable=False)
     in_progress = db.Column(db.Boolean, nullable=False, default=False)
+    category_version = db.Column(db.Integer, nullable=False, default=0)
 
     protected_object = db.relationship(ProtectedObject)
     creator = db.relationship(Account)
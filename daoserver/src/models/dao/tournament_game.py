@@ -22,6 +22,8 @@ class TournamentGame(db.Model):
     protected_object_id = db.Column(db.Integer,
                                     db.ForeignKey(ProtectedObject.id))
     score_entered = db.Column(db.Boolean)
+    scores_expected = db.Column(db.Integer, nullable=False, default=0)
+    scores_received = db.Column(db.Integer, nullable=False, default=0)
 
     protected_object = db.relationship(ProtectedObject)
     tournament_round = db.relationship(TournamentRound, \
@@ -35,6 +37,8 @@ class TournamentGame(db.Model):
         db.session.flush()
         self.protected_object_id = self.protected_object.id
         self.score_entered = False
+        self.scores_expected = 0
+        self.scores_received = 0
 
     def __repr__(self):
         return '<TournamentGame {}, {}, {}>'.format(
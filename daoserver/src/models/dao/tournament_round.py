@@ -17,6 +17,7 @@ class TournamentRound(db.Model):
         primary_key=True)
     ordering = db.Column(db.Integer, default=1, primary_key=True)
     mission = db.Column(db.String(20))
+    draw_version = db.Column(db.Integer, default=0, nullable=False)
     tournament = db.relationship(Tournament,
                                  backref=db.backref('rounds', lazy='dynamic'))
 
@@ -0,0 +1,100 @@
+"""
+Read-only snapshots of a tournament's entries
+
+Drawing, ranking and listing a tournament all start from its entries, their
+table history and their scores. Walking the TournamentEntry relationships
+costs a query or more per entry. load_entries reads the lot in a fixed number
+of queries, however big the tournament, into EntrySnapshot objects that can be
+used wherever an entry is expected.
+"""
+
+from collections import namedtuple
+
+from models.dao.db_connection import db
+from models.dao.score import Score, ScoreCategory
+from models.dao.tournament_entry import TournamentEntry
+from models.score import Category
+from models.tournament_round import get_table_history
+
+# A read-only copy of a Score. score_category is the Category scored in.
+ScoreRecord = namedtuple('ScoreRecord', [
+    'id', 'entry_id', 'value', 'score_category'])
+
+class EntrySnapshot(object):
+    """
+    The parts of a TournamentEntry the draw, ranking and listing need.
+
+    scores and score_info are None until the scores are loaded. The ranking
+    strategies set total_score, ranking and tie_breakers.
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+
+    __slots__ = ['id', 'player_id', 'tournament_id', 'game_history', 'scores',
+                 'score_info', 'total_score', 'ranking', 'tie_breakers']
+
+    def __init__(self, entry_id, player_id, tournament_id, game_history=None):
+        self.id = entry_id # pylint: disable=invalid-name
+        self.player_id = player_id
+        self.tournament_id = tournament_id
+        self.game_history = game_history
+        self.scores = None
+        self.score_info = None
+        self.total_score = None
+        self.ranking = None
+        self.tie_breakers = None
+
+    def __repr__(self):
+        return '<EntrySnapshot ({}, {}, {})>'.format(
+            self.id,
+            self.player_id,
+            self.tournament_id)
+
+def load_entries(tournament_name, scores=True, history=None):
+    """
+    Get an EntrySnapshot, with its game_history, for each entry in the
+    tournament, ordered by id. Their scores are loaded too unless scores is
+    False. history can be passed in, as get_table_history returns it, when
+    the caller has already read it.
+    """
+    # pylint: disable=no-member
+    if history is None:
+        history = get_table_history(tournament_name)
+    entries = [EntrySnapshot(entry_id, player_id, tournament_name,
+                             history.get(entry_id, [])) \
+        for entry_id, player_id in db.session.query(
+            TournamentEntry.id, TournamentEntry.player_id).\
+            filter_by(tournament_id=tournament_name).\
+            order_by(TournamentEntry.id)]
+    if scores:
+        load_scores(entries)
+    return entries
+
+def load_scores(entries):
+    """
+    Set the scores and score_info of each of the entries from one query. The
+    score_info of an entry is a list of dicts, in the order the scores were
+    entered:
+        [{'score': 10, 'category': 'painting', 'min_val': 0, 'max_val': 20}]
+    """
+    # pylint: disable=no-member
+    scores = {x.id: [] for x in entries}
+    categories = {}
+    if len(scores):
+        for row in db.session.query(
+                Score.id, Score.entry_id, Score.value,
+                *[getattr(ScoreCategory, x) for x in Category._fields]).\
+            join(ScoreCategory).\
+            filter(Score.entry_id.in_(scores.keys())).\
+            order_by(Score.id):
+            category = categories.setdefault(row[3], Category(*row[3:]))
+            scores[row[1]].append(ScoreRecord(row[0], row[1], row[2],
+                                              category))
+
+    for entry in entries:
+        entry.scores = scores[entry.id]
+        entry.score_info = [{
+            'score': x.value,
+            'category': x.score_category.name,
+            'min_val': x.score_category.min_val,
+            'max_val': x.score_category.max_val,
+        } for x in entry.scores]
@@ -2,15 +2,35 @@
 Module to make draws for tournaments
 """
 
-from collections import deque
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.expression import and_
+
+from models.dao.db_connection import db
+from models.dao.game_entry import GameEntrant
+from models.dao.tournament_game import TournamentGame
+from models.dao.tournament_round import TournamentRound
+from models.weighted_matching import max_weight_matching
+
+class Bye(object):
+    """
+    The opponent for an entry that doesn't have a game in a round. Use the
+    BYE instance rather than making more.
+    """
+
+    def __repr__(self):
+        return 'BYE'
+
+BYE = Bye()
 
 class RoundRobin(object):
     """
     Each entry plays each other entry.
 
-    Assuming a list of entries, ordered by id, each entry will play the next
-    entry in the list for the forst round. Each round the entry will play the
-    following entry, etc.
+    This is the circle method. Assuming a list of entries, ordered by id, the
+    first entry plays the last for the first round, the second plays the
+    second last, etc. and the middle entry has the bye. Each round the list
+    is rotated one place. With an even number of entries the last entry stays
+    put and plays whoever would have had the bye.
     """
 
     DRAW_FOR_ALL_ROUNDS = True
@@ -21,29 +41,151 @@ class RoundRobin(object):
 
         Returns: A list of Tuples - each is a pair of entrants.
         """
-        entry_list = deque(entry_list)
-        entry_list.rotate(round_to_draw - 1)
-        return self.determine_matchup(list(entry_list), [])
+        return list(self.pairings(round_to_draw, list(entry_list)))
 
-    def determine_matchup(self, singles, pairs):
+    def schedule(self, num_rounds, entry_list):
         """
-        Determine match ups for a round robin tournie
-        Algorithm:
-            - The first and last in the list play each other.
-            - The person in the middle is the bye, if they exist
-            - The list should be rotated in subsequent rounds.
+        Match the entrants into pairs for rounds 1 to num_rounds.
+
+        Returns: A generator of lists of Tuples, one list per round.
+        """
+        entry_list = list(entry_list)
+        for round_to_draw in range(1, num_rounds + 1):
+            yield list(self.pairings(round_to_draw, entry_list))
+
+    @staticmethod
+    def pairings(round_to_draw, entries):
+        """
+        Generate the match ups for a round of a round robin tournie
         Expects:
-            - singles is a list of all singles yet to be pairs
-            - pairs is a list of pairings:
-                ({entry from singles} or 'BYE', {entry from singles} or 'BYE')
+            - entries is a list of entry_db.Entry
         Returns:
-            - A list of Tuples of entry_db.Entry from singles
-        """
-        if len(singles) == 0:
-            return pairs
-        elif len(singles) == 1:
-            pairs.append((singles[0], 'BYE'))
-            return pairs
-        else:
-            pairs.append((singles[0], singles[-1]))
-            return self.determine_matchup(singles[1:-1], pairs)
+            - A generator of Tuples of entries. The last is (entry, BYE) for
+              an odd number of entries
+        """
+        if len(entries) == 0:
+            return
+
+        fixed = entries[-1] if len(entries) % 2 == 0 else BYE
+        rotating = len(entries) - 1 if fixed is not BYE else len(entries)
+        shift = (round_to_draw - 1) % rotating
+
+        for i in range(rotating // 2):
+            yield (entries[(i - shift) % rotating],
+                   entries[(rotating - 1 - i - shift) % rotating])
+        yield (entries[(rotating // 2 - shift) % rotating], fixed)
+
+
+class Swiss(object):
+    """
+    Entries play others near them in the standings, without rematches.
+
+    Each round is drawn from the standings after the previous round so it
+    can't be drawn in advance. Pairings come from a maximum weight matching
+    over the games between entries near each other in the standings. A game
+    costs the square of the gap in score groups between its entries, with the
+    gap in standings breaking ties, and rematches (including a second bye)
+    cost more than any other draw. Only when a rematch can't be avoided are
+    entries further apart considered.
+    """
+
+    DRAW_FOR_ALL_ROUNDS = False
+
+    def __init__(self, ranking_strategy):
+        self.ranking_strategy = ranking_strategy
+
+    def match(self, round_to_draw, entry_list):
+        """
+        Match the entrants into pairs.
+
+        Returns: A list of Tuples - each is a pair of entrants. Pairs are
+            ordered by standing and the bye, if any, is last.
+        """
+        standings = self.ranking_strategy.overall_ranking(list(entry_list))
+        if len(standings) == 0:
+            return []
+        opponents = self.get_opponents(standings, round_to_draw)
+
+        # Entries on the same total share a score group, numbered down the
+        # standings. The bye joins the lowest group.
+        groups = [0]
+        for prev, entry in zip(standings, standings[1:]):
+            groups.append(groups[-1] + (entry.total_score != prev.total_score))
+        if len(standings) % 2:
+            standings.append(BYE)
+            groups.append(groups[-1])
+
+        def played(i, j): # pylint: disable=missing-docstring
+            if standings[i] is BYE:
+                return BYE in opponents[standings[j].id]
+            elif standings[j] is BYE:
+                return BYE in opponents[standings[i].id]
+            return standings[j].id in opponents[standings[i].id]
+
+        # Each entry has a few unplayed entries close by, so a small window
+        # almost always suffices. It is widened only to avoid a rematch.
+        window = 2 * round_to_draw + 4
+        while True:
+            window = min(window, len(standings) - 1)
+            mates, rematches = self._pair(groups, played, window)
+            if rematches == 0 or window == len(standings) - 1:
+                break
+            window *= 2
+
+        return [(standings[i], standings[j]) for i, j in enumerate(mates) \
+            if i < j]
+
+    @staticmethod
+    def _pair(groups, played, window):
+        """
+        Pair up the standings, considering games between entries at most
+        window places apart.
+
+        Returns: The mates from max_weight_matching and how many rematches
+            they include
+        """
+        size = len(groups)
+        costs = {}
+        for i in range(size):
+            for j in range(i + 1, min(i + window, size - 1) + 1):
+                costs[(i, j)] = (groups[j] - groups[i]) ** 2 * window ** 2 \
+                    + (j - i) ** 2
+        rematch = max(costs.values()) * size + 1
+
+        edges = []
+        rematch_edges = set()
+        for (i, j), cost in costs.items():
+            if played(i, j):
+                rematch_edges.add((i, j))
+                cost += rematch
+            edges.append((i, j, 2 * rematch - cost))
+
+        mates = max_weight_matching(edges, max_cardinality=True)
+        return mates, len([i for i, j in enumerate(mates) \
+            if (i, j) in rematch_edges])
+
+    @staticmethod
+    def get_opponents(entries, round_to_draw):
+        """
+        Look up who each entry has played in the rounds before round_to_draw.
+
+        Returns: A dict of entry id to a list of opponent ids. A bye shows up
+            as BYE.
+        """
+        ours = aliased(GameEntrant)
+        theirs = aliased(GameEntrant)
+        # pylint: disable=no-member
+        played = db.session.query(ours.entrant_id, theirs.entrant_id).\
+            join(TournamentGame, TournamentGame.id == ours.game_id).\
+            join(TournamentRound,
+                 TournamentRound.id == TournamentGame.tournament_round_id).\
+            outerjoin(theirs, and_(theirs.game_id == ours.game_id,
+                                   theirs.entrant_id != ours.entrant_id)).\
+            filter(and_(ours.entrant_id.in_([x.id for x in entries]),
+                        TournamentRound.ordering < round_to_draw))
+
+        opponents = {x.id: [] for x in entries}
+        for entry_id, opponent_id in played:
+            opponents[entry_id].append(
+                BYE if opponent_id is None else opponent_id)
+        return opponents
@@ -7,8 +7,25 @@ have. This will vary from tournament to tournament.
 The default here is RankingStrategy. It is the null strategy so it will just
 return lists in the order they were handed in and will pick the first db entry
 as the winner of any given category.
+
+AggregateRankingStrategy ranks the same way but totals the scores in the db.
+StandingsRankingStrategy reads the totals kept in the standing table instead.
+NumpyRankingStrategy ranks from an entries x categories matrix.
+TieBreakerRankingStrategy separates level entries using their opponents.
 """
 
+import heapq
+
+import numpy
+from sqlalchemy.sql.expression import and_, cast, func
+from sqlalchemy.types import Float
+
+from models.dao.db_connection import db
+from models.dao.game_entry import GameEntrant
+from models.dao.score import GameScore, Score, ScoreCategory, Standing
+from models.dao.tournament_entry import TournamentEntry
+from models.entry_snapshot import load_scores
+
 class RankingStrategy(object):
     """
     A default RankingStrategy will return a list of entries in the order they
@@ -27,6 +44,7 @@ class RankingStrategy(object):
 
         categories = self.score_categories()
         scores = entry.scores
+        totals = []
         for cat in categories:
             agg_score = sum(
                 [x.value for x in scores \
@@ -39,11 +57,11 @@ class RankingStrategy(object):
                 agg_score = float(agg_score)
                 agg_total = float(agg_total)
                 percentage = int(cat.percentage)
-                cat.total_score = agg_score / agg_total * percentage
+                totals.append(agg_score / agg_total * percentage)
             except ZeroDivisionError:
-                cat.total_score = 0
+                totals.append(0)
 
-        return sum([x.total_score for x in categories])
+        return sum(totals)
 
     def overall_ranking(self, entries, error_on_incomplete=False): # pylint: disable=W0613
         """
@@ -52,12 +70,367 @@ class RankingStrategy(object):
         error_on_incomplete: when true this will raise a RuntimeError if any
             of the entrants have incopmlete scores.
         """
+        self.add_totals(entries)
+        return self.rank(entries)
+
+    def top_ranking(self, entries, top):
+        """
+        The first top entries of the overall ranking. They are picked with a
+        heap so the rest of the entries are never sorted.
+        """
+        self.add_totals(entries)
+        return self.rank(entries, top)
+
+    def add_totals(self, entries):
+        """
+        Set the total_score of each entry. Entries loaded without their
+        scores have them loaded first, with one query.
+        """
+        load_scores([x for x in entries if x.scores is None])
         for entry in entries:
             entry.total_score = self.total_score(entry)
 
-        entries.sort(key=lambda entry: entry.total_score, reverse=True)
+    @staticmethod
+    def rank(entries, top=None):
+        """
+        Sort entries, which already have a total_score, from highest to lowest
+        and set their ranking. Ties stay in the order they were handed in.
+
+        When top is given only the first top entries are kept.
+        """
+        if top is None:
+            entries.sort(key=lambda entry: entry.total_score, reverse=True)
+        else:
+            # nsmallest is stable, like sort
+            entries[:] = heapq.nsmallest(
+                top, entries, key=lambda entry: -entry.total_score)
 
         for i, entry in enumerate(entries):
             entry.ranking = i + 1
 
         return entries
+
+class AggregateRankingStrategy(RankingStrategy):
+    """
+    Totals are the same as RankingStrategy but they are computed for the
+    whole tournament by one grouped query rather than by walking each entry's
+    scores and their categories.
+    """
+
+    def get_category_totals(self, entry_ids=None):
+        """
+        Total up the tournament's scores by entry and category, for just the
+        entries with ids in entry_ids if it is given.
+
+        Returns: A list of rows ordered by entry and category:
+            (entry_id, category_id, score, max total, weighted score)
+            where the weighted score is score / max total * percentage, or
+            None if there is nothing to divide by.
+        """
+        # pylint: disable=no-member
+        score = func.coalesce(func.sum(Score.value), 0)
+        max_total = func.sum(ScoreCategory.max_val)
+        weighted = cast(score, Float) / func.nullif(max_total, 0) * \
+            ScoreCategory.percentage
+
+        totals = db.session.query(Score.entry_id, ScoreCategory.id, score,
+                                  max_total, weighted).\
+            join(ScoreCategory).\
+            join(TournamentEntry).\
+            filter(and_(TournamentEntry.tournament_id == self.tournament_id,
+                        ScoreCategory.tournament_id == self.tournament_id))
+        if entry_ids is not None:
+            totals = totals.filter(Score.entry_id.in_(entry_ids))
+        return totals.group_by(Score.entry_id, ScoreCategory.id).\
+            order_by(Score.entry_id, ScoreCategory.id).all()
+
+    def get_totals(self, entry_ids=None):
+        """
+        Get a dict of entry id to total score for the whole tournament, or
+        for just the entries with ids in entry_ids if it is given
+        """
+        totals = {}
+        for entry_id, _, _, _, weighted in \
+            self.get_category_totals(entry_ids):
+            totals[entry_id] = totals.get(entry_id, 0) + (weighted or 0)
+        return totals
+
+    def total_score(self, entry):
+        """
+        Calculate the total score for the entry
+        entry should be a TournamentEntry
+        """
+        return self.get_totals([entry.id]).get(entry.id, 0)
+
+    def add_totals(self, entries):
+        """Set the total_score of each entry"""
+        totals = self.get_totals()
+        for entry in entries:
+            entry.total_score = totals.get(entry.id, 0)
+
+class StandingsRankingStrategy(AggregateRankingStrategy):
+    """
+    Totals are read from the Standing rows that Score.write maintains, so
+    ranking costs the same however many rounds have been played. The
+    categories' percentage and max_val are applied as the standings are read
+    so changing a category never leaves a stale total.
+    """
+
+    def get_category_totals(self, entry_ids=None):
+        """
+        Read the tournament's standings by entry and category, for just the
+        entries with ids in entry_ids if it is given.
+
+        Returns: A list of rows ordered by entry and category:
+            (entry_id, category_id, score, max total, weighted score)
+            where the weighted score is score / max total * percentage, or
+            None if there is nothing to divide by.
+        """
+        # pylint: disable=no-member
+        max_total = Standing.num_scores * ScoreCategory.max_val
+        weighted = cast(Standing.score, Float) / func.nullif(max_total, 0) * \
+            ScoreCategory.percentage
+
+        totals = db.session.query(Standing.entry_id, ScoreCategory.id,
+                                  Standing.score, max_total, weighted).\
+            join(ScoreCategory).\
+            join(TournamentEntry).\
+            filter(and_(TournamentEntry.tournament_id == self.tournament_id,
+                        ScoreCategory.tournament_id == self.tournament_id))
+        if entry_ids is not None:
+            totals = totals.filter(Standing.entry_id.in_(entry_ids))
+        return totals.order_by(Standing.entry_id, ScoreCategory.id).all()
+
+def rank_matrix(scores, max_totals, percentages):
+    """
+    Rank entries from their scores in each category.
+
+    Expects:
+        scores - an entries x categories array of summed scores
+        max_totals - an entries x categories array of summed max_val
+        percentages - the percentage of each category
+    Returns:
+        (totals, order) - each entry's total score and the entries' indices
+        from highest total to lowest. Ties keep their original order.
+    """
+    scores = numpy.asarray(scores, dtype=numpy.float64)
+    max_totals = numpy.asarray(max_totals, dtype=numpy.float64)
+    percentages = numpy.asarray(percentages, dtype=numpy.float64)
+
+    weighted = numpy.zeros(scores.shape)
+    scored = max_totals > 0
+    weighted[scored] = scores[scored] / max_totals[scored] * \
+        numpy.broadcast_to(percentages, scores.shape)[scored]
+
+    # Add a category at a time so the sums match RankingStrategy exactly
+    totals = numpy.zeros(scores.shape[0])
+    for column in weighted.T:
+        totals += column
+
+    return totals, numpy.argsort(-totals, kind='mergesort')
+
+class NumpyRankingStrategy(AggregateRankingStrategy):
+    """
+    Totals are the same as RankingStrategy. The tournament's scores are
+    loaded into entries x categories arrays and ranked with array operations
+    by rank_matrix, which can also rank hypothetical scores.
+    """
+
+    def get_matrices(self, entry_ids):
+        """
+        Load the scores for entry_ids.
+
+        Returns: (scores, max_totals, percentages) as for rank_matrix with a
+            row per entry id and a column per score category
+        """
+        categories = self.score_categories()
+        columns = {x.id: i for i, x in enumerate(categories)}
+        rows = {x: i for i, x in enumerate(entry_ids)}
+
+        scores = numpy.zeros((len(rows), len(columns)))
+        max_totals = numpy.zeros((len(rows), len(columns)))
+        totals = [x for x in self.get_category_totals() \
+            if x[0] in rows and x[1] in columns]
+        if len(totals):
+            index = ([rows[x[0]] for x in totals],
+                     [columns[x[1]] for x in totals])
+            scores[index] = [x[2] for x in totals]
+            max_totals[index] = [x[3] for x in totals]
+
+        return scores, max_totals, [int(x.percentage) for x in categories]
+
+    def overall_ranking(self, entries, error_on_incomplete=False): # pylint: disable=W0613
+        """
+        Combines all scores for an overall ranking of entries.
+
+        error_on_incomplete: when true this will raise a RuntimeError if any
+            of the entrants have incopmlete scores.
+        """
+        scores, max_totals, percentages = \
+            self.get_matrices([x.id for x in entries])
+        totals, order = rank_matrix(scores, max_totals, percentages)
+
+        scored = (max_totals > 0).any(axis=1)
+        for entry, total, has_scores in zip(entries, totals, scored):
+            entry.total_score = float(total) if has_scores else 0
+
+        entries[:] = [entries[i] for i in order]
+        for i, entry in enumerate(entries):
+            entry.ranking = i + 1
+
+        return entries
+
+def tie_breaker_columns(totals, opponents, results):
+    """
+    Work out the opponent based tie breakers for every entry.
+
+    Expects:
+        totals - each entry's total score
+        opponents - an array of (entry index, opponent index) for every
+            entry in every game
+        results - the result for the entry in each of those pairings: 1 for
+            a win, 0.5 for a draw, 0 for a loss or NaN when not yet scored
+    Returns:
+        A dict of tie breaker name to an array with a value per entry
+    """
+    totals = numpy.asarray(totals, dtype=numpy.float64)
+    size = len(totals)
+    opponents = numpy.asarray(opponents, dtype=numpy.int64).reshape(-1, 2)
+    results = numpy.asarray(results, dtype=numpy.float64)
+    ours, theirs = opponents[:, 0], opponents[:, 1]
+    scored = ~numpy.isnan(results)
+
+    def mean(values, mask):
+        """The average of values over each entry's pairings in mask"""
+        count = numpy.bincount(ours[mask], minlength=size)
+        total = numpy.bincount(ours[mask], weights=values[mask],
+                               minlength=size)
+        return numpy.where(count > 0, total / numpy.maximum(count, 1), 0)
+
+    everyone = numpy.ones(len(ours), dtype=bool)
+    win_percentage = mean(results, scored)
+    level = scored & (totals[ours] == totals[theirs])
+
+    return {
+        'win_percentage': win_percentage,
+        'strength_of_schedule': mean(totals[theirs], everyone),
+        'opponents_win_percentage': mean(win_percentage[theirs], everyone),
+        'head_to_head': numpy.bincount(ours[level], weights=results[level],
+                                       minlength=size)
+    }
+
+class TieBreakerRankingStrategy(StandingsRankingStrategy):
+    """
+    Entries are ranked by total score and then, for entries that are level,
+    by each of tie_breakers in turn:
+        - strength_of_schedule - the average total score of their opponents
+        - opponents_win_percentage - the average win percentage of their
+          opponents
+        - win_percentage - wins (draws count as half) per scored game
+        - head_to_head - their results against opponents on the same total
+    A game is won by the entrant with the higher sum of scores in it.
+    """
+
+    TIE_BREAKERS = ['head_to_head', 'opponents_win_percentage',
+                    'strength_of_schedule', 'win_percentage']
+
+    def __init__(self, tournament_id, score_categories_func,
+                 tie_breakers=None):
+        super(TieBreakerRankingStrategy, self).__init__(
+            tournament_id, score_categories_func)
+        if tie_breakers is None:
+            tie_breakers = ['strength_of_schedule',
+                            'opponents_win_percentage', 'head_to_head']
+        for tie_breaker in tie_breakers:
+            if tie_breaker not in self.TIE_BREAKERS:
+                raise ValueError('Unknown tie breaker: {}'.format(tie_breaker))
+        self.tie_breakers = tie_breakers
+
+    def get_game_results(self):
+        """
+        Get every entrant in every game of the tournament.
+
+        Returns: A list of (game_id, entry_id, points) ordered by game where
+            points is the sum of the entry's scores in the game, or None.
+        """
+        # pylint: disable=no-member
+        points = db.session.query(GameScore.game_id, GameScore.entry_id,
+                                  func.sum(Score.value).label('points')).\
+            join(Score).\
+            join(TournamentEntry, TournamentEntry.id == GameScore.entry_id).\
+            filter(TournamentEntry.tournament_id == self.tournament_id).\
+            group_by(GameScore.game_id, GameScore.entry_id).subquery()
+
+        return db.session.query(GameEntrant.game_id, GameEntrant.entrant_id,
+                                points.c.points).\
+            select_from(GameEntrant).\
+            join(TournamentEntry,
+                 TournamentEntry.id == GameEntrant.entrant_id).\
+            outerjoin(points,
+                      and_(points.c.game_id == GameEntrant.game_id,
+                           points.c.entry_id == GameEntrant.entrant_id)).\
+            filter(TournamentEntry.tournament_id == self.tournament_id).\
+            order_by(GameEntrant.game_id, GameEntrant.entrant_id).all()
+
+    def get_opponent_graph(self, entry_ids):
+        """
+        Build the opponent pairings for entry_ids from one query.
+
+        Returns: (opponents, results) as for tie_breaker_columns
+        """
+        rows = {x: i for i, x in enumerate(entry_ids)}
+        games = {}
+        for game_id, entry_id, points in self.get_game_results():
+            if entry_id in rows:
+                games.setdefault(game_id, []).append((rows[entry_id], points))
+
+        opponents = []
+        results = []
+        for entrants in games.values():
+            for ours, our_points in entrants:
+                for theirs, their_points in entrants:
+                    if ours == theirs:
+                        continue
+                    opponents.append((ours, theirs))
+                    if our_points is None or their_points is None:
+                        results.append(float('nan'))
+                    else:
+                        results.append(
+                            (cmp(our_points, their_points) + 1) / 2.0)
+        return opponents, results
+
+    def overall_ranking(self, entries, error_on_incomplete=False): # pylint: disable=W0613
+        """
+        Combines all scores for an overall ranking of entries. Each entry
+        also gets a dict of its tie_breakers.
+
+        error_on_incomplete: when true this will raise a RuntimeError if any
+            of the entrants have incopmlete scores.
+        """
+        self.add_totals(entries)
+
+        columns = tie_breaker_columns(
+            [x.total_score for x in entries],
+            *self.get_opponent_graph([x.id for x in entries]))
+        for i, entry in enumerate(entries):
+            entry.tie_breakers = {x: float(columns[x][i]) \
+                for x in self.tie_breakers}
+
+        # lexsort is stable and sorts by the last key first
+        keys = [-columns[x] for x in reversed(self.tie_breakers)]
+        keys.append(numpy.negative([x.total_score for x in entries],
+                                   dtype=numpy.float64))
+        order = numpy.lexsort(keys)
+
+        entries[:] = [entries[i] for i in order]
+        for i, entry in enumerate(entries):
+            entry.ranking = i + 1
+
+        return entries
+
+    def top_ranking(self, entries, top):
+        """
+        The first top entries of the overall ranking. Every entry is needed to
+        work out the tie breakers so this ranks them all.
+        """
+        return self.overall_ranking(entries)[:top]
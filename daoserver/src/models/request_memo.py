@@ -0,0 +1,38 @@
+"""
+Request scoped memo of DAO lookups
+
+Models look their DAO up by name or id every time get_dao is called, which
+can be many times while serving one request. get_memo keeps the DAO found on
+flask.g so each is only looked up once per request. The memo is emptied
+whenever the session's transaction ends, i.e. on commit, rollback or close,
+so a DAO that was changed or removed is read again.
+"""
+
+from flask import g, has_app_context
+from sqlalchemy import event
+
+from models.dao.db_connection import db
+
+def get_memo(key, load):
+    """
+    Get the DAO for key from the memo, calling load to find it if it isn't
+    there. Outside of a request, or when load finds nothing, nothing is
+    remembered.
+    """
+    if not has_app_context():
+        return load()
+
+    memo = g.setdefault('dao_memo', {})
+    dao = memo.get(key)
+    if dao is None:
+        dao = load()
+        if dao is not None:
+            memo[key] = dao
+    return dao
+
+def clear_memo(*args): # pylint: disable=unused-argument
+    """Forget every DAO in the memo"""
+    if has_app_context():
+        g.pop('dao_memo', None)
+
+event.listen(db.session, 'after_transaction_end', clear_memo)
@@ -1,15 +1,201 @@
 """
 Logic for scores goes here
 """
-from sqlalchemy.exc import DataError, IntegrityError
-from sqlalchemy.sql.expression import and_
+from collections import namedtuple
+
+from sqlalchemy.exc import DataError
+from sqlalchemy.sql.expression import and_, func, or_, select
 
 from models.dao.db_connection import db
 from models.dao.game_entry import GameEntrant
 from models.dao.score import Score as DAO, ScoreCategory, TournamentScore, \
-GameScore
+GameScore, Standing
 from models.dao.tournament_entry import TournamentEntry
 from models.dao.tournament_game import TournamentGame
+from models.dao.tournament_round import TournamentRound as TR
+
+# A read-only copy of a ScoreCategory that can be shared between requests
+Category = namedtuple('Category', [
+    'id', 'tournament_id', 'name', 'percentage', 'per_tournament', 'min_val',
+    'max_val', 'zero_sum', 'opponent_score'])
+
+# Score categories keyed by tournament name. Each is stored with the id and
+# category_version of the tournament it was read for so the categories of a
+# deleted tournament, or ones that have since changed, are never served.
+CATEGORY_CACHE = {}
+
+class TournamentCategories(object):
+    """The Category of each of a tournament's ScoreCategory"""
+
+    def __init__(self, version, categories):
+        self.version = version
+        self.categories = categories
+        self.by_name = {x.name: x for x in categories}
+        self.by_id = {x.id: x for x in categories}
+
+def get_categories(tournament_dao):
+    """
+    Get the TournamentCategories for tournament_dao from CATEGORY_CACHE unless
+    they have changed since they were read.
+    """
+    version = (tournament_dao.id, tournament_dao.category_version)
+    cached = CATEGORY_CACHE.get(tournament_dao.name)
+    if cached is not None and cached.version == version:
+        return cached
+
+    # pylint: disable=no-member
+    cached = TournamentCategories(version, [
+        Category(*[getattr(x, field) for field in Category._fields]) \
+        for x in ScoreCategory.query.\
+            filter_by(tournament_id=tournament_dao.name).\
+            order_by(ScoreCategory.id)])
+    CATEGORY_CACHE[tournament_dao.name] = cached
+    return cached
+
+def clear_categories(tournament_name):
+    """Remove a tournament's categories from CATEGORY_CACHE"""
+    CATEGORY_CACHE.pop(tournament_name, None)
+
+def count_game_scores(games):
+    """
+    Recount scores_expected and scores_received for the games in the query
+    games with one UPDATE. The caller commits.
+    """
+    # pylint: disable=no-member
+    per_game = select([func.count(ScoreCategory.id)]).\
+        where(and_(ScoreCategory.tournament_id == TR.tournament_name,
+                   TR.id == TournamentGame.tournament_round_id,
+                   ~ScoreCategory.per_tournament)).as_scalar()
+    entrants = select([func.count(GameEntrant.entrant_id)]).\
+        where(GameEntrant.game_id == TournamentGame.id).as_scalar()
+    received = select([func.count(GameScore.score_id)]).\
+        where(GameScore.game_id == TournamentGame.id).as_scalar()
+    games.update({'scores_expected': per_game * entrants,
+                  'scores_received': received},
+                 synchronize_session=False)
+
+def check_score(score, category, game):
+    """
+    Check a score is in range for category and is entered for a game, or
+    not, as category requires. Raises ValueError or TypeError.
+    """
+    if score < category.min_val or score > category.max_val:
+        raise ValueError('Invalid score: {}'.format(score))
+
+    if game is None and not category.per_tournament:
+        raise TypeError('{} should be entered per-tournament'.\
+            format(category.name))
+
+    if game is not None and category.per_tournament:
+        raise TypeError('Cannot enter a per-tournament score '\
+            '({}) for a game (id: {})'.format(category.name, game.id))
+
+def add_to_standings(totals):
+    """
+    Add scores to the entries' Standings. The caller commits.
+
+    Expects: totals - a dict of (entry_id, category_id) to (score, num_scores)
+    """
+    # pylint: disable=no-member
+    # Lock the entries so concurrent scores for them queue up here
+    TournamentEntry.query.\
+        filter(TournamentEntry.id.in_(set(x[0] for x in totals))).\
+        order_by(TournamentEntry.id).with_for_update().all()
+
+    new = []
+    for (entry_id, category_id), (score, num_scores) in totals.items():
+        updated = Standing.query.filter_by(
+            entry_id=entry_id, score_category_id=category_id).\
+            update({'score': Standing.score + score,
+                    'num_scores': Standing.num_scores + num_scores},
+                   synchronize_session=False)
+        if not updated:
+            new.append({'entry_id': entry_id, 'score_category_id': category_id,
+                        'score': score, 'num_scores': num_scores})
+    if len(new):
+        db.session.execute(Standing.__table__.insert().values(new))
+
+def add_game_scores(counts):
+    """
+    Count new scores towards their games being complete. The caller commits.
+
+    Expects: counts - a dict of game id to the number of new scores
+    """
+    # pylint: disable=no-member
+    for game_id, count in counts.items():
+        received = TournamentGame.scores_received + count
+        TournamentGame.query.filter_by(id=game_id).update({
+            'scores_received': received,
+            'score_entered': or_(
+                TournamentGame.score_entered,
+                and_(TournamentGame.scores_expected > 0,
+                     received >= TournamentGame.scores_expected))
+        }, synchronize_session=False)
+
+class GameValidator(object):
+    """
+    Checks scores for a game against its entrants and the scores it already
+    has. These are loaded up front so any number of scores can be checked
+    without further queries.
+    """
+
+    def __init__(self, game, entrants, scores):
+        self.game = game
+        self.entrants = entrants
+        self.scores = scores
+
+    @staticmethod
+    def load(games):
+        """
+        Build a GameValidator for each of games with two queries.
+
+        Returns: A dict of game id to GameValidator
+        """
+        # pylint: disable=no-member
+        entrants = {x.id: [] for x in games}
+        scores = {x.id: {} for x in games}
+        if len(entrants):
+            for game_id, entry in db.session.query(GameEntrant.game_id,
+                                                   TournamentEntry).\
+                join(TournamentEntry).\
+                filter(GameEntrant.game_id.in_(entrants.keys())).\
+                order_by(GameEntrant.entrant_id):
+                entrants[game_id].append(entry)
+            for game_id, entry_id, category_id, value in db.session.query(
+                    GameScore.game_id, DAO.entry_id, DAO.score_category_id,
+                    DAO.value).\
+                join(DAO).filter(GameScore.game_id.in_(scores.keys())):
+                scores[game_id][(entry_id, category_id)] = value
+
+        return {x.id: GameValidator(x, entrants[x.id], scores[x.id]) \
+            for x in games}
+
+    def opponent(self, entry_id):
+        """The entrant in the game that isn't entry_id, or None for a BYE"""
+        return next((x for x in self.entrants if x.id != entry_id), None)
+
+    def validate(self, entry_id, category, score):
+        """
+        Check a score for entry_id in category could be entered. Raises
+        ValueError or TypeError.
+        """
+        check_score(score, category, self.game)
+
+        if (entry_id, category.id) in self.scores:
+            raise ValueError('{} not entered. Score is already set'.\
+                format(score))
+
+        # If zero sum we need to check the score entered by the opponent
+        if category.zero_sum:
+            existing_score = sum(value or 0 for (entry, cat), value in \
+                self.scores.items() if cat == category.id and entry != entry_id)
+            if existing_score + score > category.max_val:
+                raise ValueError('Invalid score: {}'.format(score))
+
+    def add(self, entry_id, category, score):
+        """Validate a score and include it when checking later scores"""
+        self.validate(entry_id, category, score)
+        self.scores[(entry_id, category.id)] = score
 
 class Score(object):
     """Model for a score in a tournament or game"""
@@ -35,18 +221,23 @@ class Score(object):
             raise TypeError('{} not entered. Game {} cannot be found'.\
                 format(self.score, game_id))
 
-        self.category = ScoreCategory.query.filter_by(
-            tournament_id=self.tournament.name, name=args['category']).first()
+        self.category = get_categories(self.tournament).by_name.\
+            get(args['category'])
 
         if self.category is None:
             raise TypeError('Unknown category: {}'.format(args['category']))
 
-        if self.category.opponent_score:
-            self.entry = self.game.entrants.filter(
-                GameEntrant.entrant_id != args['entry_id']).first().entrant
-        else:
-            self.entry = TournamentEntry.query.\
-                filter_by(id=args['entry_id']).first()
+        self.entry_id = args['entry_id']
+        self.validator = None
+        if self.game is not None:
+            self.validator = args.get('validator') or \
+                GameValidator.load([self.game])[self.game.id]
+
+        self.entry = TournamentEntry.query.\
+            filter_by(id=args['entry_id']).first()
+        if self.entry is not None and self.category.opponent_score and \
+            self.game is not None:
+            self.entry = self.validator.opponent(self.entry.id)
         if self.entry is None:
             raise ValueError('Unknown entrant: {}'.format(args['entry_id']))
 
@@ -69,88 +260,190 @@ class Score(object):
     @staticmethod
     def is_score_entered(game_dao):
         """
-        Determine if all the scores have been entered for this game.
-        Not that, if false, the result will be double checked and possibly
-        updated
+        Determine if all the scores have been entered for this game from its
+        scores_received and scores_expected counters. Nothing is written: the
+        counters are kept up to date when the draw is made, the categories
+        change and scores are entered. A game expecting no scores is not
+        complete.
         """
-        if game_dao is not None and game_dao.score_entered:
+        if game_dao.score_entered:
             return True
+        return 0 < game_dao.scores_expected <= game_dao.scores_received
 
-        per_game_scores = len(game_dao.tournament_round.tournament.\
-            score_categories.filter_by(per_tournament=False).all())
-        if per_game_scores <= 0:
-            raise AttributeError(
-                '{} does not have any scores associated with it'.\
-                format(game_dao.tournament_round.tournament.name))
+    def validate(self):
+        """Validate an entered score. Returns True or raises Exception"""
+        if self.validator is not None:
+            self.validator.validate(self.entry.id, self.category, self.score)
+        else:
+            check_score(self.score, self.category, self.game)
 
-        scores_expected = per_game_scores * len(game_dao.entrants.all())
 
-        if len(game_dao.game_scores.all()) == scores_expected:
-            game_dao.score_entered = True
-            db.session.add(game_dao)
-            db.session.commit()
-            return True
+    def write(self):
+        """
+        Enters a score for category into tournament for player. This goes
+        through write_scores like any other submission.
 
-        return False
+        Expects: score - integer
+        """
+        return _enter_scores(self.tournament, self.entry_id, [(
+            self.category.name,
+            None if self.game is None else self.game.id,
+            self.score)])[0]
 
+def write_scores(tournament, entry_id, scores):
+    """
+    Enter several scores for an entry in one transaction. Everything needed
+    is loaded with a few bulk queries and every score is validated before
+    any are written so either all of them are entered or none are.
 
-    def validate(self):
-        """Validate an entered score. Returns True or raises Exception"""
-        invalid_score = ValueError('Invalid score: {}'.format(self.score))
-        if self.score < self.category.min_val \
-        or self.score > self.category.max_val:
-            raise invalid_score
+    Expects:
+        tournament - a Tournament
+        entry_id - the entry submitting the scores
+        scores - a list of dicts with keys category, score and, for per game
+            categories, game_id
+    Returns: a list of messages, one per score
+    """
+    tourn = tournament.get_dao()
+    submitted = []
+    for args in scores:
+        try:
+            score = int(args.get('score'))
+        except TypeError:
+            raise ValueError('Score not entered: {}'.format(args.get('score')))
+        game_id = args.get('game_id', None)
+        if game_id is not None:
+            try:
+                game_id = int(game_id)
+            except ValueError:
+                raise TypeError('{} not entered. Game {} cannot be found'.\
+                    format(score, game_id))
+        submitted.append((args['category'], game_id, score))
+    return _enter_scores(tourn, entry_id, submitted)
 
-        if self.game is None and not self.category.per_tournament:
-            raise TypeError('{} should be entered per-tournament'.\
-                format(self.category.name))
+def _enter_scores(tourn, entry_id, submitted):
+    """
+    Check and write submitted, a list of (category name, game id, score),
+    for entry_id in the tournament DAO tourn in one transaction.
 
-        if self.game is not None and self.category.per_tournament:
-            raise TypeError('Cannot enter a per-tournament score '\
-                '({}) for a game (id: {})'.\
-                format(self.category.name, self.game.id))
+    Returns: a list of messages, one per score
+    """
+    if not len(submitted):
+        return []
 
-        # If zero sum we need to check the score entered by the opponent
-        if self.game is not None and self.category.zero_sum:
-            # pylint: disable=no-member
-            game_scores = GameScore.query.join(DAO, ScoreCategory).\
-                    filter(and_(GameScore.game_id == self.game.id,
-                                ScoreCategory.name == self.category.name,
-                                GameScore.entry_id != self.entry.id)).all()
-            existing_score = sum([x.score.value for x in game_scores])
-            if existing_score + self.score > self.category.max_val:
-                raise invalid_score
+    rows = _resolve_scores(tourn, entry_id, submitted)
+    _check_tournament_scores(tourn, rows)
 
+    try:
+        _insert_scores(tourn, rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
 
-    def write(self):
-        """
-        Enters a score for category into tournament for player.
+    return ['Score entered for {}: {}'.format(scored.player_id, score) \
+        for scored, _, _, score in rows]
 
-        Expects: score - integer
-        """
-        self.validate()
-        if self.get_dao() is not None:
+def _resolve_scores(tourn, entry_id, submitted):
+    """
+    Load the categories, games and entries for submitted, a list of
+    (category name, game id, score), and check each score. Scores for games
+    are checked by GameValidator, including against each other.
+
+    Returns: a list of (entry scored, category, game, score)
+    """
+    # pylint: disable=no-member
+    categories = get_categories(tourn).by_name
+    game_ids = set(x[1] for x in submitted if x[1] is not None)
+    validators = GameValidator.load(TournamentGame.query.\
+        filter(TournamentGame.id.in_(game_ids)).all() \
+        if len(game_ids) else [])
+    entry = TournamentEntry.query.\
+        filter_by(id=entry_id, tournament_id=tourn.name).first()
+    if entry is None:
+        raise ValueError('Unknown entrant: {}'.format(entry_id))
+
+    rows = []
+    for name, game_id, score in submitted:
+        category = categories.get(name)
+        if category is None:
+            raise TypeError('Unknown category: {}'.format(name))
+        validator = validators.get(game_id)
+        if game_id is not None and validator is None:
+            raise TypeError('{} not entered. Game {} cannot be found'.\
+                format(score, game_id))
+        if validator is not None and \
+            entry.id not in [x.id for x in validator.entrants]:
+            raise ValueError('{} not entered. Entry {} is not in game {}'.\
+                format(score, entry_id, game_id))
+
+        scored = entry
+        if category.opponent_score and validator is not None:
+            scored = validator.opponent(entry.id)
+        if scored is None:
+            raise ValueError('Unknown entrant: {}'.format(entry_id))
+
+        if validator is None:
+            check_score(score, category, None)
+            rows.append((scored, category, None, score))
+        else:
+            validator.add(scored.id, category, score)
+            rows.append((scored, category, validator.game, score))
+    return rows
+
+def _check_tournament_scores(tourn, rows):
+    """
+    Check none of the per tournament scores in rows, from _resolve_scores,
+    has been entered already with one query.
+    """
+    # pylint: disable=no-member
+    rows = [x for x in rows if x[2] is None]
+    if not len(rows):
+        return
+
+    entered = set(db.session.query(DAO.entry_id, DAO.score_category_id).\
+        join(TournamentScore).\
+        filter(and_(TournamentScore.tournament_id == tourn.id,
+                    DAO.entry_id.in_(set(x[0].id for x in rows)))))
+    for scored, category, _, score in rows:
+        if (scored.id, category.id) in entered:
             raise ValueError('{} not entered. Score is already set'.\
-                format(self.score))
+                format(score))
+        entered.add((scored.id, category.id))
 
-        try:
-            score_dao = DAO(self.entry.id, self.category.id, self.score)
-            db.session.add(score_dao)
-            db.session.flush()
+def _insert_scores(tourn, rows): # pylint: disable=too-many-locals
+    """
+    Insert rows, from _resolve_scores, with one multi-row INSERT per table
+    and update the standings and games. The caller commits.
+    """
+    ids = [x[0] for x in db.session.execute(
+        select([func.nextval('score_id_seq')]).\
+        select_from(func.generate_series(1, len(rows))))]
+    db.session.execute(DAO.__table__.insert().values([{
+        'id': score_id,
+        'entry_id': scored.id,
+        'score_category_id': category.id,
+        'value': score
+    } for score_id, (scored, category, _, score) in zip(ids, rows)]))
 
-            if self.game is not None:
-                db.session.add(
-                    GameScore(self.entry.id, self.game.id, score_dao.id))
-            else:
-                db.session.add(TournamentScore(self.entry.id, \
-                    self.tournament.id, score_dao.id))
-            db.session.commit()
-        except IntegrityError as err:
-            db.session.rollback()
-            if 'is not present in table "entry"' in err.__repr__():
-                raise AttributeError('{} not entered. Entry {} doesn\'t exist'.\
-                    format(self.score, self.entry.id))
-            raise err
+    game_scores = [{'entry_id': scored.id, 'game_id': game.id,
+                    'score_id': score_id} \
+        for score_id, (scored, _, game, _) in zip(ids, rows) \
+        if game is not None]
+    tournament_scores = [{'entry_id': scored.id, 'tournament_id': tourn.id,
+                          'score_id': score_id} \
+        for score_id, (scored, _, game, _) in zip(ids, rows) \
+        if game is None]
+    for table, values in [(GameScore, game_scores),
+                          (TournamentScore, tournament_scores)]:
+        if len(values):
+            db.session.execute(table.__table__.insert().values(values))
 
-        return 'Score entered for {}: {}'.\
-            format(self.entry.player_id, self.score)
+    totals = {}
+    counts = {}
+    for scored, category, game, score in rows:
+        total, num_scores = totals.get((scored.id, category.id), (0, 0))
+        totals[(scored.id, category.id)] = (total + score, num_scores + 1)
+        if game is not None:
+            counts[game.id] = counts.get(game.id, 0) + 1
+    add_to_standings(totals)
+    add_game_scores(counts)
@@ -2,7 +2,68 @@
 Module to contain table allocation strategy
 """
 
-import itertools
+import time
+
+import numpy
+
+def min_cost_assignment(costs): # pylint: disable=too-many-locals
+    """
+    Solve the assignment problem for a square cost matrix using the Hungarian
+    algorithm (with potentials). Runs in O(n3) for n rows.
+
+    Expects:
+        A list of n lists, each of n numbers. costs[i][j] is the cost of
+        assigning row i to column j
+    Returns:
+        A list where element i is the column assigned to row i
+    """
+    size = len(costs)
+    # Rows and columns are 1-indexed here. Column 0 is a virtual column used
+    # to start each augmenting path.
+    row_pot = [0] * (size + 1)
+    col_pot = [0] * (size + 1)
+    col_row = [0] * (size + 1)
+    way = [0] * (size + 1)
+
+    for row in range(1, size + 1):
+        col_row[0] = row
+        col = 0
+        min_slack = [float('inf')] * (size + 1)
+        used = [False] * (size + 1)
+        while col_row[col] != 0:
+            used[col] = True
+            cur_row = col_row[col]
+            cur_costs = costs[cur_row - 1]
+            delta = float('inf')
+            next_col = 0
+            for cand in range(1, size + 1):
+                if used[cand]:
+                    continue
+                slack = cur_costs[cand - 1] - row_pot[cur_row] - col_pot[cand]
+                if slack < min_slack[cand]:
+                    min_slack[cand] = slack
+                    way[cand] = col
+                if min_slack[cand] < delta:
+                    delta = min_slack[cand]
+                    next_col = cand
+            for cand in range(size + 1):
+                if used[cand]:
+                    row_pot[col_row[cand]] += delta
+                    col_pot[cand] -= delta
+                else:
+                    min_slack[cand] -= delta
+            col = next_col
+
+        # Flip the augmenting path
+        while col != 0:
+            prev = way[col]
+            col_row[col] = col_row[prev]
+            col = prev
+
+    assignment = [0] * size
+    for col in range(1, size + 1):
+        assignment[col_row[col] - 1] = col - 1
+    return assignment
 
 class LayoutProtest(object):
     """
@@ -11,13 +72,14 @@ class LayoutProtest(object):
         - 0_protests - count of games for where neither entry protested
         - 1_protests - count of games for where 1 entry protested
         - 2_protests - count of games for where both entries protested
+    Games with more entrants get a count for each possible number of protests.
     """
-    def __init__(self):
-        self.protests = [0, 0, 0]
+    def __init__(self, num_entrants=2):
+        self.protests = [0] * (num_entrants + 1)
 
     def total_protests(self):
         """ Sum of all protests. A double protest counts as two individuals."""
-        return self.protests[1] + self.protests[2] * 2
+        return sum(i * x for i, x in enumerate(self.protests))
 
     def __repr__(self):
         rep = [x for x in self.protests]
@@ -32,24 +94,84 @@ class Table(object):
         self.table_number = int(table_number)
         self.entrants = entrants
 
-    def protest_score(self):
+    def protest_score(self, history=None):
         """
         Get the protest score for a single game.
         Returns a single protest score between 0 and len(entries)
+
+        history is a TableHistory. By default one is made for the entrants.
+        """
+        if history is None:
+            history = TableHistory(self.entrants)
+        return history.count_protests(self.entrants, self.table_number)
+
+class TableHistory(object):
+    """
+    An index of the tables each entry has played on.
+
+    This is an entries x tables boolean matrix. Build it once, from the
+    entries' game_history, and reuse it for every layout considered.
+    game_history can instead be a dict of entry id to tables played on.
+
+    Row 0 is always empty. Anything that isn't in the index, such as a BYE,
+    uses it and so never protests.
+    """
+
+    def __init__(self, entries=(), game_history=None):
+        if game_history is None:
+            history = [(x, getattr(x, 'game_history', None)) \
+                for x in set(entries)]
+        else:
+            history = [(x, game_history.get(x.id)) for x in set(entries) \
+                if hasattr(x, 'id')]
+        history = [(x, played) for x, played in history if played]
+        self.rows = {x: i + 1 for i, (x, _) in enumerate(history)}
+
+        tables = [[t for t in played if t >= 0] for _, played in history]
+        self.matrix = numpy.zeros(
+            (len(history) + 1, max([0] + [t for x in tables for t in x]) + 1),
+            dtype=bool)
+        for i, played in enumerate(tables):
+            self.matrix[i + 1, played] = True
+
+    def count_protests(self, entrants, table_number):
+        """Count the entrants who have played on table_number before"""
+        if not 0 <= table_number < self.matrix.shape[1]:
+            return 0
+        rows = [self.rows.get(x, 0) for x in entrants]
+        return int(self.matrix[rows, table_number].sum())
+
+    def get_protests(self, games, num_tables=None):
         """
-        protests = 0
-        try:
-            for entry in self.entrants:
-                if self.table_number in entry.game_history:
-                    protests += 1
-        except AttributeError:
-            pass
+        Get the games x tables matrix of protest scores.
 
-        return protests
+        Expects:
+            A list of games. Each game is a list of Entry (or BYE)
+            num_tables - the number of tables. Defaults to len(games)
+        Returns:
+            A numpy array where [i, j] is the protest score for game i on
+            table j + 1
+        """
+        if num_tables is None:
+            num_tables = len(games)
+        rows = [self.rows.get(x, 0) for game in games for x in game]
+
+        # Tables beyond the history are empty and vice-versa
+        width = min(num_tables + 1, self.matrix.shape[1])
+        history = numpy.zeros((len(rows), num_tables + 1), dtype=numpy.int64)
+        history[:, :width] = self.matrix[rows, :width]
+
+        game_of_entrant = numpy.repeat(numpy.arange(len(games)),
+                                       [len(x) for x in games])
+        protests = numpy.zeros((len(games), num_tables + 1),
+                               dtype=numpy.int64)
+        numpy.add.at(protests, game_of_entrant, history)
+
+        return protests[:, 1:]
 
 class ProtestAvoidanceStrategy(object):
     """
-    Allocate tables by determining all possible options and allocating based on
+    Allocate tables by searching the possible layouts for the one with the
     fewest protests.
 
     Algorithm:
@@ -62,8 +184,18 @@ class ProtestAvoidanceStrategy(object):
             - A layout is a single possible configuration of entrants on
             tables. Essentially this is one candidate for final configuration.
         Allocation:
-            - For all possible layouts, determine the aggregate protest
-            - The least protested layout is chosen
+            - The least protested layout is chosen. If time_budget runs out
+            first the least protested layout found so far is used instead.
+        Search:
+            - The games in the order drawn are the first layout tried. If
+            nobody protests that layout is used without searching.
+            - Otherwise layouts are built a table at a time, depth first, in
+            the same order as itertools.permutations
+            - A partial layout is abandoned once its protests, plus the
+            fewest protests each empty table could still get, can't beat the
+            best layout found so far
+            - The search stops early on a layout with no protests, or when
+            time_budget seconds have passed
         Variations:
             - There are four obvious variations:
                 - Avoid double protests - Least Outrage
@@ -73,22 +205,31 @@ class ProtestAvoidanceStrategy(object):
                 - Avoid no protests - least variety
                 - Lowest aggregate protest - Utility happiness
         Time-complexity:
-            - n3 for n games
+            - n! layouts for n games in the worst case, with n2 work to bound
+            each partial layout. Pruning usually cuts this a long way and
+            time_budget caps it, at the cost of the result no longer being
+            known to be the least protested.
         Memory Complexity:
-            - 4 * n3 integers for n games.
-        Potential Trade-off:
-            A reasonably complex select to get table history for each player
-            could be stored with the entry.
+            - n2 integers for n games, the games x tables protest scores.
     """
 
+    def __init__(self, time_budget=None):
+        """
+        time_budget: the number of seconds the search may run for before the
+            best layout found so far is used. None means the search always
+            runs to completion and so always finds the least protested layout.
+        """
+        self.time_budget = time_budget
+
     @staticmethod
-    def get_protest_score_for_layout(layout):
+    def get_protest_score_for_layout(layout, history=None):
         """
         Get the protest scores for a single layout
 
         Expects:
             List of Table
-            Note that the game might simply be the string 'BYE'
+            Note that an entrant might simply be BYE
+            history - a TableHistory. By default one is made for the entrants.
         Returns:
             A LayoutProtest
         """
@@ -99,14 +240,17 @@ class ProtestAvoidanceStrategy(object):
         if any(len(x.entrants) != num_entries for x in layout):
             raise IndexError('Some games have differing numbers of entries')
 
-        protest = LayoutProtest()
+        if history is None:
+            history = TableHistory(
+                entry for game in layout for entry in game.entrants)
+
+        protest = LayoutProtest(num_entries)
         for game in layout:
-            protest.protests[game.protest_score()] += 1
+            protest.protests[game.protest_score(history)] += 1
 
         return protest
 
-    # pylint: disable=R0201
-    def determine_tables(self, drawn_games):
+    def determine_tables(self, drawn_games, history=None):
         """
         The main method that returns a table configuration.
 
@@ -115,22 +259,182 @@ class ProtestAvoidanceStrategy(object):
             will be used for determining the draw.
         Expects:
             A list of games. Each game should be a tuple of 2 Entry
+            history - a TableHistory. By default one is made for the entrants.
 
         Returns:
             A list of Table
         """
-        permutations = list(itertools.permutations(drawn_games))
-        permutations = [
-            [Table(i+1, list(e)) for i, e in enumerate(x)] \
-            for x in permutations]
+        return self.search(drawn_games, history)[0]
+
+    def search(self, drawn_games, history=None):
+        """
+        Find the least protested layout, giving up when time_budget runs out.
+
+        Expects:
+            A list of games. Each game should be a tuple of 1 or more Entry
+            history - a TableHistory. By default one is made for the entrants.
+
+        Returns:
+            A tuple of:
+                - the best layout found, a list of Table
+                - True if that layout is known to be the least protested
+        """
+        games = [list(x) for x in drawn_games]
+        layout = [Table(i + 1, x) for i, x in enumerate(games)]
+        if history is None:
+            history = TableHistory(entry for game in games for entry in game)
+
+        # The first permutation is the starting point. This also checks all
+        # the games are the same size.
+        best = {
+            'protests': ProtestAvoidanceStrategy.\
+                get_protest_score_for_layout(layout, history).total_protests(),
+            'order': range(len(games)),
+            'deadline': None if self.time_budget is None \
+                else time.time() + self.time_budget,
+            'timed_out': False,
+        }
+
+        if best['protests'] > 0:
+            scores = history.get_protests(games).tolist()
+            self._branch(scores, [], 0, best)
+
+        layout = [Table(table + 1, games[i]) \
+            for table, i in enumerate(best['order'])]
+        return layout, not best['timed_out']
+
+    @staticmethod
+    def _branch(scores, order, protests, best):
+        """
+        Try each unused game on the next empty table.
+
+        scores[game][table] is the protest score for a game on a table. order
+        is the games on the tables so far and protests their total. best holds
+        the best complete order and is updated in place.
+
+        Returns False when the search should stop.
+        """
+        if best['deadline'] is not None and time.time() >= best['deadline']:
+            best['timed_out'] = True
+            return False
+
+        table = len(order)
+        if table == len(scores):
+            if protests < best['protests']:
+                best['protests'] = protests
+                best['order'] = list(order)
+            return best['protests'] > 0
+
+        unused = [i for i in range(len(scores)) if i not in order]
+
+        # No layout from here can do better than the empty tables' best case
+        bound = protests + sum(min(scores[i][empty] for i in unused) \
+            for empty in range(table, len(scores)))
+        if bound >= best['protests']:
+            return True
+
+        for i in unused:
+            order.append(i)
+            keep_going = ProtestAvoidanceStrategy._branch(
+                scores, order, protests + scores[i][table], best)
+            order.pop()
+            if not keep_going:
+                return False
+
+        return True
+
+
+class MinCostAssignmentStrategy(object):
+    """
+    Allocate tables by treating the draw as an assignment problem.
+
+    Algorithm:
+        Cost:
+            - Look up the entrants in a TableHistory, an entries x tables
+            matrix of where each entry has played before.
+            - Sum it per game to get a games x tables matrix of protest
+            scores, then weight those by the objective.
+        Allocation:
+            - Find the cheapest way to give every game a table using the
+            Hungarian algorithm.
+            - A layout's cost is the sum of its tables' costs so this is the
+            best layout for the objective without looking at every
+            permutation.
+            - Where layouts tie, games stay on the table they were drawn for.
+        Objectives:
+            - utility - lowest aggregate protest. This gives the same least
+            protested layout as ProtestAvoidanceStrategy.
+            - least_outrage - avoid games where every entrant protests, then
+            lowest aggregate protest
+            - split - avoid games where only some entrants protest, then
+            lowest aggregate protest
+        Time-complexity:
+            - n3 for n games
+        Memory Complexity:
+            - n2 integers for n games.
+    """
+
+    OBJECTIVES = ['least_outrage', 'split', 'utility']
+
+    def __init__(self, objective='utility'):
+        if objective not in self.OBJECTIVES:
+            raise ValueError('Unknown table objective: {}. Choose from {}'.\
+                format(objective, ', '.join(self.OBJECTIVES)))
+        self.objective = objective
+
+    def determine_tables(self, drawn_games, history=None):
+        """
+        The main method that returns a table configuration.
+
+        Assumptions:
+            Each Entry is expected to have a correct playing history as this
+            will be used for determining the draw.
+        Expects:
+            A list of games. Each game should be a tuple of 2 Entry
+            history - a TableHistory. By default one is made for the entrants.
+
+        Returns:
+            A list of Table
+        """
+        games = [list(x) for x in drawn_games]
+        if history is None:
+            history = TableHistory(entry for game in games for entry in game)
+        costs = self.get_costs(games, history)
+
+        # The objective dominates. The tie-break (moving a game off the table
+        # it was drawn for) can add at most len(games) - 1 so never outweighs
+        # a difference in cost.
+        costs = costs * (len(games) + 1) + \
+            (1 - numpy.eye(len(games), dtype=numpy.int64))
+
+        layout = [None] * len(games)
+        for i, table in enumerate(min_cost_assignment(costs.tolist())):
+            layout[table] = Table(table + 1, games[i])
+
+        return layout
+
+    def get_costs(self, games, history):
+        """
+        Get the games x tables matrix of costs for the objective.
+
+        Expects:
+            A list of games. Each game is a list of Entry (or BYE)
+            history - a TableHistory
+        Returns:
+            A numpy array where [i, j] is the cost of game i on table j + 1
+        """
+        protests = history.get_protests(games)
+        sizes = numpy.array([len(x) for x in games], dtype=numpy.int64).\
+            reshape(-1, 1)
 
-        protests = [
-            (ProtestAvoidanceStrategy.get_protest_score_for_layout(x), x) \
-            for x in permutations
-        ]
+        if self.objective == 'utility':
+            return protests
 
-        protests.sort(cmp=lambda x, y: cmp(
-            x[0].total_protests(),
-            y[0].total_protests()))
+        # Enough that a single penalised game outweighs all other protests
+        penalty = int(sizes.sum()) + 1
+        if self.objective == 'least_outrage':
+            penalised = (protests == sizes) & (sizes > 0)
+        else:
+            penalised = (protests > 0) & (protests < sizes)
 
-        return protests[0][1]
+        return protests + penalty * penalised
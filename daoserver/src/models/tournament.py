@@ -7,23 +7,32 @@ from datetime import date, datetime
 from json import dumps
 
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.sql.expression import and_
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import func as sql_func
+from sqlalchemy.sql.expression import and_, null, tuple_
 
 from models.authentication import PermissionDeniedException
 from models.dao.db_connection import db
 from models.dao.permissions import AccountProtectedObjectPermission, \
 ProtectedObject, ProtObjPerm
+from models.dao.game_entry import GameEntrant
 from models.dao.registration import TournamentRegistration as Reg
-from models.dao.score import ScoreCategory
-from models.dao.table_allocation import TableAllocation
+from models.dao.score import GameScore, Score, ScoreCategory, Standing, \
+TournamentScore
 from models.dao.tournament import Tournament as TournamentDAO
 from models.dao.tournament_entry import TournamentEntry
+from models.dao.tournament_game import TournamentGame
 from models.dao.tournament_round import TournamentRound as TR
-from models.matching_strategy import RoundRobin
+from models.entry_snapshot import load_entries, load_scores
+from models.matching_strategy import BYE, RoundRobin
 from models.permissions import PermissionsChecker
-from models.ranking_strategies import RankingStrategy
-from models.table_strategy import ProtestAvoidanceStrategy
-from models.tournament_round import TournamentRound, DrawException
+from models.ranking_strategies import StandingsRankingStrategy
+from models.request_memo import get_memo
+from models.score import clear_categories, count_game_scores, \
+get_categories
+from models.table_strategy import MinCostAssignmentStrategy, TableHistory
+from models.tournament_round import TournamentRound, bump_draw_versions, \
+get_round_tables, remove_games, remove_rounds, scored_rounds, write_draws
 
 def must_exist_in_db(func):
     """ A decorator that requires the tournament exists in the db"""
@@ -31,6 +40,16 @@ def must_exist_in_db(func):
         return func(self.check_exists(), *args, **kwargs)
     return wrapped
 
+# The orders list_tournaments can page through, with the columns of each key
+LISTING_ORDERS = {
+    'name': [TournamentDAO.name],
+    'date': [TournamentDAO.date, TournamentDAO.name]
+}
+
+# The fields of each row from Tournament.export_results, in order
+RESULT_FIELDS = ['username', 'entry_id', 'round', 'table', 'game_id',
+                 'opponent', 'category', 'score']
+
 PROGRESS_EXCEPTION = ValueError('You cannot perform this action on a '\
                                 'tournament that is in progress')
 def not_in_progress(func):
@@ -53,9 +72,9 @@ class Tournament(object):
     def __init__(self, tournament_id=None):
         self.tournament_id = tournament_id
         self.matching_strategy = RoundRobin()
-        self.table_strategy = ProtestAvoidanceStrategy()
-        self.ranking_strategy = RankingStrategy(tournament_id,
-                                                self.get_score_categories)
+        self.table_strategy = MinCostAssignmentStrategy()
+        self.ranking_strategy = StandingsRankingStrategy(
+            tournament_id, self.get_score_categories)
 
     def check_exists(self):
         """Check that this Tournament has a corresponding DAO"""
@@ -67,28 +86,48 @@ class Tournament(object):
 
     def get_dao(self):
         """Convenience method to recover TournamentDAO"""
-        return TournamentDAO.query.filter_by(name=self.tournament_id).first()
+        return get_memo(
+            ('tournament', self.tournament_id),
+            TournamentDAO.query.filter_by(name=self.tournament_id).first)
 
 
+    @must_exist_in_db
     @not_in_progress
     def delete(self):
-        """Delete a tournament"""
+        """
+        Delete a tournament and everything in it. Each table is cleared with
+        one set based DELETE however big the tournament is.
+        """
         dao = self.get_dao()
-        self.update({
-            'rounds': 0,
-            'score_categories': []
-        })
-        Reg.query.filter_by(tournament_id=dao.id).delete()
-        TournamentEntry.query.filter_by(tournament_id=dao.name).delete()
+        entries = db.session.query(TournamentEntry.id).\
+            filter_by(tournament_id=dao.name)
+        perms = db.session.query(ProtObjPerm.id).\
+            filter_by(protected_object_id=dao.protected_object_id)
+
+        for query in [
+                GameScore.query.filter(GameScore.entry_id.in_(entries)),
+                TournamentScore.query.filter(
+                    TournamentScore.entry_id.in_(entries)),
+                Standing.query.filter(Standing.entry_id.in_(entries)),
+                Score.query.filter(Score.entry_id.in_(entries)),
+                ScoreCategory.query.filter_by(tournament_id=dao.name)]:
+            query.delete(synchronize_session=False)
+        remove_rounds(TR.query.filter_by(tournament_name=dao.name))
+        Reg.query.filter_by(tournament_id=dao.id).\
+            delete(synchronize_session=False)
+        TournamentEntry.query.filter_by(tournament_id=dao.name).\
+            delete(synchronize_session=False)
+
         db.session.delete(dao)
         db.session.flush()
-        AccountProtectedObjectPermission.query.\
-            filter_by(account_username=dao.to_username).delete()
-        ProtObjPerm.query.\
-            filter_by(protected_object_id=dao.protected_object.id).delete()
-        ProtectedObject.query.filter_by(id=dao.protected_object.id).\
-            delete()
+        AccountProtectedObjectPermission.query.filter(
+            AccountProtectedObjectPermission.protected_object_permission_id.\
+            in_(perms)).delete(synchronize_session=False)
+        perms.delete(synchronize_session=False)
+        ProtectedObject.query.filter_by(id=dao.protected_object_id).\
+            delete(synchronize_session=False)
         db.session.commit()
+        clear_categories(self.tournament_id)
 
 
     @not_in_progress
@@ -155,24 +194,71 @@ class Tournament(object):
 
 
     @must_exist_in_db
-    def get_entries(self):
-        """Get a list of Entry"""
-
-        entries = TournamentEntry.query.\
-            filter_by(tournament_id=self.tournament_id).all()
-        for entry in entries:
-            entry.game_history = [x.table_no for x in \
-                TableAllocation.query.filter_by(entry_id=entry.id)]
-            entry.score_info = [
-                {
-                    'score': x.value,
-                    'category': x.score_category.name,
-                    'min_val': x.score_category.min_val,
-                    'max_val': x.score_category.max_val,
-                } for x in entry.scores
-            ]
-
-        return entries
+    def export_results(self, batch_size=500):
+        """
+        Yield a dict, with the keys in RESULT_FIELDS, for each score entered
+        for each entry in each game. An entry's game with no scores yet, or
+        an entry with no games, still gets a row with the missing values
+        None. These are followed by the per tournament scores.
+
+        Rows are read from server side cursors batch_size at a time so the
+        memory used is the same however big the tournament is.
+        """
+        # pylint: disable=no-member
+        opponent_game = aliased(GameEntrant)
+        opponent = aliased(TournamentEntry)
+        game_rows = db.session.query(
+            TournamentEntry.player_id, TournamentEntry.id, TR.ordering,
+            TournamentGame.table_num, TournamentGame.id, opponent.player_id,
+            ScoreCategory.name, Score.value).\
+            select_from(TournamentEntry).\
+            outerjoin(GameEntrant,
+                      GameEntrant.entrant_id == TournamentEntry.id).\
+            outerjoin(TournamentGame,
+                      TournamentGame.id == GameEntrant.game_id).\
+            outerjoin(TR, TR.id == TournamentGame.tournament_round_id).\
+            outerjoin(opponent_game,
+                      and_(opponent_game.game_id == GameEntrant.game_id,
+                           opponent_game.entrant_id != TournamentEntry.id)).\
+            outerjoin(opponent, opponent.id == opponent_game.entrant_id).\
+            outerjoin(GameScore,
+                      and_(GameScore.game_id == GameEntrant.game_id,
+                           GameScore.entry_id == TournamentEntry.id)).\
+            outerjoin(Score, Score.id == GameScore.score_id).\
+            outerjoin(ScoreCategory,
+                      ScoreCategory.id == Score.score_category_id).\
+            filter(TournamentEntry.tournament_id == self.tournament_id).\
+            order_by(TournamentEntry.id, TR.ordering, ScoreCategory.id)
+
+        tournament_rows = db.session.query(
+            TournamentEntry.player_id, TournamentEntry.id, null(), null(),
+            null(), null(), ScoreCategory.name, Score.value).\
+            select_from(TournamentScore).\
+            join(Score, Score.id == TournamentScore.score_id).\
+            join(ScoreCategory, ScoreCategory.id == Score.score_category_id).\
+            join(TournamentEntry, TournamentEntry.id == Score.entry_id).\
+            filter(TournamentScore.tournament_id == self.get_dao().id).\
+            order_by(TournamentEntry.id, ScoreCategory.id)
+
+        for query in [game_rows, tournament_rows]:
+            for row in query.yield_per(batch_size):
+                yield dict(zip(RESULT_FIELDS, row))
+
+    @must_exist_in_db
+    def get_entries(self, score_info=True):
+        """
+        Get a list of EntrySnapshot, ordered by id, in a fixed number of
+        queries.
+
+        score_info can be turned off when the caller will only need the
+        scores, via add_score_info, for some of the entries.
+        """
+        return load_entries(self.tournament_id, scores=score_info)
+
+    @staticmethod
+    def add_score_info(entries):
+        """Set the scores and score_info of each entry from one query"""
+        load_scores(entries)
 
 
     @must_exist_in_db
@@ -200,12 +286,12 @@ class Tournament(object):
         List all the score categories available to this tournie and their
         percentages.
 
-        If 'serialized' returns list of dicts rather than sqlalchemy objects:
+        The categories are Category tuples from the category cache. If
+        'serialized' returns list of dicts rather than Category:
         [{ 'name': 'Painting', 'percentage': 20, 'id': 1,
            'per_tournament': False }]
         """
-        cats = ScoreCategory.query.\
-            filter_by(tournament_id=self.tournament_id).all()
+        cats = list(get_categories(self.get_dao()).categories)
         return [{
             'id':             x.id,
             'name':           x.name,
@@ -220,15 +306,61 @@ class Tournament(object):
 
     @must_exist_in_db
     def make_draws(self):
-        """Makes the draws for all rounds"""
+        """
+        Makes the draws for all rounds
+
+        The entries and their tables are read once and every round's pairings
+        and tables are worked out in memory. Each round's table history is the
+        rounds before it, as just drawn. The old games are then replaced in a
+        single transaction with a fixed number of set based statements,
+        however many rounds or entries there are. Rounds with scores entered
+        keep their draw.
+        """
         # If we can we determine all rounds
-        if self.matching_strategy.DRAW_FOR_ALL_ROUNDS:
-            for rnd in range(0, self.get_dao().rounds.count()):
-                try:
-                    self.get_round(rnd + 1).destroy_draw()
-                    self.get_round(rnd + 1).make_draw(self.get_entries())
-                except DrawException:
-                    pass
+        if not self.matching_strategy.DRAW_FOR_ALL_ROUNDS:
+            return
+
+        rounds = self.get_dao().rounds.order_by(TR.ordering).all()
+        scored = scored_rounds([x.id for x in rounds])
+        draws = self._draw_rounds([x for x in rounds if x.id not in scored],
+                                  len(rounds))
+
+        removed = remove_games([rnd.id for rnd, _ in draws])
+        changed = write_draws(self.tournament_id, draws)
+        bump_draw_versions(
+            [rnd for rnd, _ in draws if removed or rnd.id in changed])
+        db.session.commit()
+
+    def _draw_rounds(self, rounds, num_rounds):
+        """
+        Work out the draws for rounds, a list of round DAOs in order, in
+        memory from one read of the entries and the tables they have played
+        on. num_rounds is how many rounds the schedule is for.
+
+        Returns: A list of (round DAO, list of Table)
+        """
+        tables = get_round_tables(self.tournament_id)
+        entries = load_entries(self.tournament_id, scores=False, history={
+            x: [y[z] for z in sorted(y)] for x, y in tables.items()})
+        schedule = list(self.matching_strategy.schedule(num_rounds, entries))
+
+        draws = []
+        for rnd in rounds:
+            history = TableHistory(entries, {
+                x: [y[z] for z in sorted(y) if z < rnd.ordering] \
+                for x, y in tables.items()})
+            draw = self.table_strategy.determine_tables(
+                schedule[rnd.ordering - 1], history)
+            draws.append((rnd, draw))
+
+            for played in tables.values():
+                played.pop(rnd.ordering, None)
+            for table in draw:
+                for entrant in table.entrants:
+                    if entrant is not BYE:
+                        tables.setdefault(entrant.id, {})[rnd.ordering] = \
+                            table.table_number
+        return draws
 
 
     @must_exist_in_db
@@ -255,9 +387,7 @@ class Tournament(object):
         dao.date = details.get('date', dao.date)
 
         cats = details.get('score_categories', None)
-        deserialised = [ScoreCategory(tournament_id=self.tournament_id, **x) \
-            for x in cats] if cats is not None else None
-        if cats is not None and self.get_score_categories() != deserialised:
+        if cats is not None:
             self._set_score_categories(cats)
 
         rounds = details.get('rounds')
@@ -325,9 +455,7 @@ class Tournament(object):
         """Set the number of rounds in a tournament"""
         num_rounds = int(num_rounds)
 
-        for rnd in self.get_dao().rounds.filter(TR.ordering > num_rounds).\
-        order_by(TR.ordering.desc()).all():
-            self.get_round(rnd.ordering).db_remove(False)
+        remove_rounds(self.get_dao().rounds.filter(TR.ordering > num_rounds))
 
         for rnd in range(self.get_dao().rounds.count(), num_rounds):
             db.session.add(TR(self.tournament_id, rnd + 1))
@@ -341,8 +469,11 @@ class Tournament(object):
     @not_in_progress
     def _set_score_categories(self, new_categories):
         """
-        Replace the existing score categories with those from the list. The list
-        should contain a ScoreCategorys
+        Replace the existing score categories with those from the list of
+        dicts. Only the differences are written: new categories are inserted,
+        changed ones updated and those no longer wanted deleted, along with
+        their scores, by a few set based DELETEs. The percentages are checked
+        before anything is written.
         """
         # check for duplicates
         keys = [cat['name'] for cat in new_categories]
@@ -351,33 +482,43 @@ class Tournament(object):
 
         # pylint: disable=broad-except
         try:
-            # Delete the ones no longer needed
-            score_cats = self.get_dao().score_categories
-            if len(keys) > 0: # we must keep some
-                score_cats = score_cats.filter(~ScoreCategory.name.in_(keys))
-            for cat in score_cats.all():
-                for score in cat.scores:
-                    score.game_scores.delete()
-                    score.tournament_scores.delete()
-                cat.scores.delete()
-            score_cats.delete(synchronize_session='fetch')
+            existing = {x.name: x for x in self.get_dao().score_categories}
+            per_game = set(x for x in existing \
+                if not existing[x].per_tournament)
 
+            daos = []
             for cat in new_categories:
-                dao = ScoreCategory.query.\
-                    filter_by(tournament_id=self.tournament_id,
-                              name=cat['name']).first()
+                dao = existing.get(cat['name'])
                 if dao is None:
                     dao = ScoreCategory(tournament_id=self.tournament_id, **cat)
                 else:
                     dao.update(tournament_id=self.tournament_id, **cat)
-
-                db.session.add(dao)
-                db.session.flush()
-
-                ScoreCategory.query.\
-                    filter_by(tournament_id=self.tournament_id,
-                              name=cat['name']).first().clashes()
-
+                daos.append(dao)
+
+            total = 0
+            for dao in daos:
+                total += dao.percentage
+                if total > 100:
+                    raise ValueError('percentage too high: {}'.format(dao))
+
+            removed = [x for x in existing.values() if x.name not in keys]
+            changed = len(removed) or any(
+                x.id is None or db.session.is_modified(x) for x in daos)
+            self._delete_score_categories(removed)
+            db.session.add_all(daos)
+            db.session.flush()
+            if changed:
+                TournamentDAO.query.filter_by(id=self.get_dao().id).update(
+                    {'category_version': TournamentDAO.category_version + 1},
+                    synchronize_session='evaluate')
+
+            # The scores each game expects only change with the per game
+            # categories
+            if per_game != set(x.name for x in daos if not x.per_tournament):
+                count_game_scores(TournamentGame.query.filter(
+                    TournamentGame.tournament_round_id.in_(
+                        db.session.query(TR.id).\
+                        filter_by(tournament_name=self.tournament_id))))
             db.session.commit()
         except ValueError:
             db.session.rollback()
@@ -386,6 +527,29 @@ class Tournament(object):
             db.session.rollback()
             raise
 
+    @staticmethod
+    def _delete_score_categories(categories):
+        """
+        Delete the ScoreCategory in categories and every score in them. The
+        caller commits.
+        """
+        if not len(categories):
+            return
+
+        cat_ids = [x.id for x in categories]
+        scores = db.session.query(Score.id).\
+            filter(Score.score_category_id.in_(cat_ids))
+        for query in [
+                GameScore.query.filter(GameScore.score_id.in_(scores)),
+                TournamentScore.query.filter(
+                    TournamentScore.score_id.in_(scores)),
+                Standing.query.filter(Standing.score_category_id.in_(cat_ids)),
+                Score.query.filter(Score.score_category_id.in_(cat_ids)),
+                ScoreCategory.query.filter(ScoreCategory.id.in_(cat_ids))]:
+            query.delete(synchronize_session=False)
+        for category in categories:
+            db.session.expunge(category)
+
     @must_exist_in_db
     @not_in_progress
     def update(self, details):
@@ -427,3 +591,58 @@ def all_tournaments_with_permission(action, username):
             pass
 
     return modifiable_tournaments
+
+def list_tournaments(username=None, from_date=None, to_date=None,
+                     order='name', after=None, limit=None):
+    # pylint: disable=too-many-arguments
+    """
+    Get the name, date, number of rounds and entries of tournaments, and
+    whether username has entered each, with one query.
+
+    from_date and to_date are dates and limit the tournaments to those
+    on or between them. Pages are fetched by key, i.e. after is the key of the
+    last tournament of the previous page, in the order given:
+        - name - (name, )
+        - date - (date, name)
+
+    Returns: A list of dicts in order, at most limit long
+    """
+    if order not in LISTING_ORDERS:
+        raise ValueError('Unknown order: {}'.format(order))
+    key = LISTING_ORDERS[order]
+
+    rounds = db.session.query(
+        TR.tournament_name.label('name'),
+        sql_func.count(TR.id).label('rounds')).\
+        group_by(TR.tournament_name).subquery()
+    entries = db.session.query(
+        TournamentEntry.tournament_id.label('name'),
+        sql_func.count(TournamentEntry.id).label('entries'),
+        sql_func.bool_or(TournamentEntry.player_id == username).\
+            label('user_entered')).\
+        group_by(TournamentEntry.tournament_id).subquery()
+
+    query = db.session.query(
+        TournamentDAO.name, TournamentDAO.date,
+        sql_func.coalesce(rounds.c.rounds, 0),
+        sql_func.coalesce(entries.c.entries, 0),
+        sql_func.coalesce(entries.c.user_entered, False)).\
+        outerjoin(rounds, rounds.c.name == TournamentDAO.name).\
+        outerjoin(entries, entries.c.name == TournamentDAO.name)
+    if from_date is not None:
+        query = query.filter(TournamentDAO.date >= from_date)
+    if to_date is not None:
+        query = query.filter(TournamentDAO.date <= to_date)
+    if after is not None:
+        query = query.filter(tuple_(*key) > tuple_(*after))
+    query = query.order_by(*key)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return [{
+        'name': name,
+        'date': tourn_date,
+        'rounds': num_rounds,
+        'entries': num_entries,
+        'user_entered': user_entered
+    } for name, tourn_date, num_rounds, num_entries, user_entered in query]
@@ -4,8 +4,12 @@ Model of a tournament
 It holds a tournament object for housing of scoring strategies, etc.
 """
 from models.dao.account import Account
+from models.dao.game_entry import GameEntrant
 from models.dao.tournament_entry import TournamentEntry as DAO
-from models.score import Score
+from models.dao.tournament_game import TournamentGame
+from models.dao.tournament_round import TournamentRound
+from models.request_memo import get_memo
+from models.score import Score, write_scores
 from models.tournament import Tournament
 
 class TournamentEntry(object):
@@ -18,7 +22,8 @@ class TournamentEntry(object):
     def get_dao(self):
         """Convenience method to recover TournamentEntry DAO"""
         # pylint: disable=no-member
-        return DAO.query.filter_by(id=self.entry_id).first()
+        return get_memo(('entry', self.entry_id),
+                        DAO.query.filter_by(id=self.entry_id).first)
 
     @staticmethod
     def get_entry_id(tourn, username):
@@ -53,8 +58,10 @@ class TournamentEntry(object):
 
     def get_next_game(self):
         """Get the next game for given entry"""
-        games = [gent.game for gent in self.get_dao().game_entries]
-        games = sorted(games, key=lambda game: game.tournament_round.ordering)
+        # pylint: disable=no-member
+        games = TournamentGame.query.join(GameEntrant).join(TournamentRound).\
+            filter(GameEntrant.entrant_id == self.entry_id).\
+            order_by(TournamentRound.ordering)
 
         for game in games:
             if not Score.is_score_entered(game):
@@ -94,12 +101,9 @@ class TournamentEntry(object):
             - game_id - The id of the game that the score is for
             - category - the category e.g. painting, round_6_battle
             - score - the score. Integer
-        """
 
-        scores = [Score(entry_id=self.get_dao().id, tournament=self.tournament,
-                        score=x['score'], category=x['category'],
-                        game_id=x.get('game_id', None)) for x in scores]
-
-        messages = [s.write() for s in scores]
+        The scores are all entered, in one transaction, or none are.
+        """
+        messages = write_scores(self.tournament, self.entry_id, scores)
 
         return messages[0] if len(messages) == 1 else '\n'.join(messages)
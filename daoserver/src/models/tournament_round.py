@@ -2,15 +2,283 @@
 Model of a Tournament Round
 """
 
-from sqlalchemy.sql.expression import and_
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.sql.expression import and_, case, func, literal_column, \
+select
 
 from models.dao.db_connection import db
 from models.dao.game_entry import GameEntrant
-from models.dao.permissions import ProtObjAction, ProtObjPerm
+from models.dao.permissions import AccountProtectedObjectPermission, \
+ProtectedObject, ProtObjAction, ProtObjPerm
+from models.dao.table_allocation import TableAllocation
 from models.dao.tournament_entry import TournamentEntry
 from models.dao.tournament_game import TournamentGame
 from models.dao.tournament_round import TournamentRound as DAO
-from models.permissions import PermissionsChecker, PERMISSIONS
+from models.matching_strategy import BYE
+from models.permissions import PERMISSIONS
+from models.score import count_game_scores
+from models.table_strategy import TableHistory
+
+# Draws read back from the db, keyed by (tournament, round ordering). Each is
+# stored with the round id and draw_version it was read at so a stale draw, or
+# one from a deleted round, is never served.
+DRAW_CACHE = {}
+
+def get_table_history(tournament_name, before_round=None):
+    """
+    Get the tables each entry in a tournament has played on, in round order.
+
+    before_round limits this to rounds earlier than the round given.
+
+    Returns: A dict of entry id to a list of table numbers
+    """
+    # pylint: disable=no-member
+    history = db.session.query(
+        TableAllocation.entry_id,
+        func.array_agg(aggregate_order_by(TableAllocation.table_no,
+                                          TableAllocation.round_no))).\
+        join(TournamentEntry).\
+        filter(TournamentEntry.tournament_id == tournament_name)
+    if before_round is not None:
+        history = history.filter(TableAllocation.round_no < before_round)
+    return dict(history.group_by(TableAllocation.entry_id))
+
+def get_round_tables(tournament_name):
+    """
+    Get the table each entry in a tournament played on in each round.
+
+    Returns: A dict of entry id to a dict of round number to table number
+    """
+    # pylint: disable=no-member
+    tables = {}
+    for entry_id, round_no, table_no in db.session.query(
+            TableAllocation.entry_id, TableAllocation.round_no,
+            TableAllocation.table_no).\
+        join(TournamentEntry).\
+        filter(TournamentEntry.tournament_id == tournament_name):
+        tables.setdefault(entry_id, {})[round_no] = table_no
+    return tables
+
+def clear_table_allocations(tournament_name, orderings):
+    """
+    Remove the table allocations for a tournament's rounds numbered in
+    orderings with one DELETE. The caller commits.
+    """
+    # pylint: disable=no-member
+    TableAllocation.query.filter(and_(
+        TableAllocation.round_no.in_(orderings),
+        TableAllocation.entry_id.in_(
+            db.session.query(TournamentEntry.id).\
+            filter_by(tournament_id=tournament_name)))).\
+        delete(synchronize_session=False)
+
+def scored_rounds(round_ids):
+    """
+    Find which of the rounds with ids in round_ids have a game, other than a
+    BYE, with its scores entered, with one query.
+
+    Returns: A set of round ids
+    """
+    # pylint: disable=no-member
+    if not len(round_ids):
+        return set()
+    return set(x for x, in db.session.query(
+        TournamentGame.tournament_round_id).\
+        join(GameEntrant).\
+        filter(and_(TournamentGame.tournament_round_id.in_(round_ids),
+                    TournamentGame.score_entered)).\
+        group_by(TournamentGame.tournament_round_id, TournamentGame.id).\
+        having(func.count(GameEntrant.entrant_id) > 1))
+
+def bump_draw_versions(rounds):
+    """
+    Mark the draws for the round DAOs in rounds as changed with one UPDATE.
+    The caller commits.
+    """
+    # pylint: disable=no-member
+    if not len(rounds):
+        return
+    DAO.query.filter(DAO.id.in_([x.id for x in rounds])).\
+        update({'draw_version': DAO.draw_version + 1},
+               synchronize_session=False)
+    for rnd in rounds:
+        db.session.expire(rnd, ['draw_version'])
+
+def remove_games(round_ids):
+    """
+    Remove the games of the rounds with ids in round_ids, with their game
+    entrants, permissions and protected objects, using one DELETE per table.
+    The caller commits.
+
+    Returns: The number of games removed
+    """
+    # pylint: disable=no-member
+    games = db.session.query(TournamentGame.id).\
+        filter(TournamentGame.tournament_round_id.in_(round_ids))
+    prot_obj_ids = [x for x, in db.session.query(
+        TournamentGame.protected_object_id).\
+        filter(TournamentGame.tournament_round_id.in_(round_ids))]
+    if not len(prot_obj_ids):
+        return 0
+    perms = db.session.query(ProtObjPerm.id).\
+        filter(ProtObjPerm.protected_object_id.in_(prot_obj_ids))
+
+    AccountProtectedObjectPermission.query.filter(
+        AccountProtectedObjectPermission.protected_object_permission_id.\
+        in_(perms)).delete(synchronize_session=False)
+    ProtObjPerm.query.filter(
+        ProtObjPerm.protected_object_id.in_(prot_obj_ids)).\
+        delete(synchronize_session=False)
+    GameEntrant.query.filter(GameEntrant.game_id.in_(games)).\
+        delete(synchronize_session=False)
+    removed = TournamentGame.query.filter(
+        TournamentGame.tournament_round_id.in_(round_ids)).\
+        delete(synchronize_session=False)
+    ProtectedObject.query.filter(ProtectedObject.id.in_(prot_obj_ids)).\
+        delete(synchronize_session=False)
+    return removed
+
+def remove_rounds(rounds):
+    """
+    Remove the rounds in the query rounds, with their games, game entrants,
+    permissions and table allocations. Each table is cleared with one set based
+    DELETE however many games there are. The caller commits.
+    """
+    # pylint: disable=no-member
+    found = rounds.with_entities(DAO.id, DAO.tournament_name, DAO.ordering).\
+        all()
+    if not len(found):
+        return
+    round_ids = [x[0] for x in found]
+
+    remove_games(round_ids)
+
+    for tournament_name in set(x[1] for x in found):
+        clear_table_allocations(
+            tournament_name, [x[2] for x in found if x[1] == tournament_name])
+    DAO.query.filter(DAO.id.in_(round_ids)).delete(synchronize_session=False)
+
+def write_draws(tournament_name, draws):
+    # pylint: disable=too-many-locals,too-many-branches
+    """
+    Write the draws for some of a tournament's rounds to the db. The caller
+    commits.
+
+    Games already in the db are reused. Everything else, for every round, is
+    written with one multi-row INSERT per table, using ids taken from the
+    sequences in a single query, rather than a few queries per entrant.
+
+    Expects: draws - a list of (round DAO, list of Table)
+    Returns: The ids of the rounds whose games or entrants changed
+    """
+    # pylint: disable=no-member
+    round_ids = [rnd.id for rnd, _ in draws]
+    games = {(x.tournament_round_id, x.table_num): x for x in \
+        TournamentGame.query.filter(
+            TournamentGame.tournament_round_id.in_(round_ids))}
+    act_id = ProtObjAction.query.\
+        filter_by(description=PERMISSIONS['ENTER_SCORE']).first().id
+    entered = set()
+    perms = {}
+    if len(games):
+        entered = set(db.session.query(GameEntrant.game_id,
+                                       GameEntrant.entrant_id).\
+            join(TournamentGame).\
+            filter(TournamentGame.tournament_round_id.in_(round_ids)))
+        perms = dict(db.session.query(ProtObjPerm.protected_object_id,
+                                      ProtObjPerm.id).\
+            filter(and_(ProtObjPerm.protected_object_id.in_(
+                [x.protected_object_id for x in games.values()]),
+                        ProtObjPerm.protected_object_action_id == act_id)))
+
+    new_tables = [(rnd, table) for rnd, draw in draws for table in draw \
+        if (rnd.id, table.table_number) not in games]
+    unprotected = [x for x in games.values() \
+        if x.protected_object_id not in perms]
+    ids = []
+    if len(new_tables) or len(unprotected):
+        # Only new games need a game and protected object id. Postgres only
+        # evaluates the CASE branch taken so no other ids are used up.
+        new = literal_column('n') <= len(new_tables)
+        ids = db.session.execute(select([
+            case([(new, func.nextval('protected_object_id_seq'))]),
+            case([(new, func.nextval('game_id_seq'))]),
+            func.nextval('protected_object_permission_id_seq')]).\
+            select_from(func.generate_series(
+                1, len(new_tables) + len(unprotected)).alias('n'))).fetchall()
+
+    new_objects = []
+    new_games = []
+    for (rnd, table), (prot_obj_id, game_id, _) in zip(new_tables, ids):
+        new_objects.append({'id': prot_obj_id})
+        new_games.append({
+            'id':                  game_id,
+            'tournament_round_id': rnd.id,
+            'table_num':           table.table_number,
+            'protected_object_id': prot_obj_id,
+            # The person playing the bye gets no points at the time
+            'score_entered':       BYE in table.entrants
+        })
+    for game, (_, _, perm_id) in zip(unprotected, ids[len(new_tables):]):
+        perms[game.protected_object_id] = perm_id
+    for game, (_, _, perm_id) in zip(new_games, ids):
+        perms[game['protected_object_id']] = perm_id
+
+    game_ids = {key: (x.id, x.protected_object_id) \
+        for key, x in games.items()}
+    game_ids.update({(x['tournament_round_id'], x['table_num']): \
+        (x['id'], x['protected_object_id']) for x in new_games})
+
+    changed = set(x['tournament_round_id'] for x in new_games)
+    entrants = []
+    account_perms = []
+    allocations = []
+    byes = []
+    for rnd, draw in draws:
+        for table in draw:
+            game_id, prot_obj_id = game_ids[(rnd.id, table.table_number)]
+            for entrant in table.entrants:
+                if entrant is BYE:
+                    if (rnd.id, table.table_number) in games:
+                        byes.append(game_id)
+                    continue
+                allocations.append({'entry_id': entrant.id,
+                                    'table_no': table.table_number,
+                                    'round_no': rnd.ordering})
+                if (game_id, entrant.id) not in entered:
+                    changed.add(rnd.id)
+                    entrants.append({'game_id': game_id,
+                                     'entrant_id': entrant.id})
+                    account_perms.append({
+                        'account_username':               entrant.player_id,
+                        'protected_object_permission_id': perms[prot_obj_id]
+                    })
+
+    new_perms = [{
+        'id':                         perms[x],
+        'protected_object_id':        x,
+        'protected_object_action_id': act_id
+    } for x in [y['protected_object_id'] for y in new_games] + \
+        [y.protected_object_id for y in unprotected]]
+
+    clear_table_allocations(tournament_name, [rnd.ordering for rnd, _ in draws])
+    for table, rows in [(ProtectedObject, new_objects),
+                        (TournamentGame, new_games),
+                        (ProtObjPerm, new_perms),
+                        (GameEntrant, entrants),
+                        (AccountProtectedObjectPermission, account_perms),
+                        (TableAllocation, allocations)]:
+        if len(rows):
+            db.session.execute(table.__table__.insert().values(rows))
+
+    if len(byes):
+        TournamentGame.query.filter(TournamentGame.id.in_(byes)).\
+            update({'score_entered': True}, synchronize_session='fetch')
+
+    if len(changed):
+        count_game_scores(TournamentGame.query.filter(
+            TournamentGame.tournament_round_id.in_(changed)))
+    return changed
 
 class DrawException(Exception):
     """For when a draw cannot be completed as scores entered already"""
@@ -29,47 +297,60 @@ class TournamentRound(object):
 
     def db_remove(self, commit=True):
         """Remove the dao and all associated games, entrants, etc. from db"""
-        for game in self.get_dao().games:
-            entrants = GameEntrant.query.filter_by(game_id=game.id)
-            for entrant in entrants.all():
-                PermissionsChecker().remove_permission(
-                    entrant.entrant.player_id,
-                    PERMISSIONS['ENTER_SCORE'],
-                    game.protected_object)
-            entrants.delete()
-            act_id = ProtObjAction.query.\
-                filter_by(description=PERMISSIONS['ENTER_SCORE']).first().id
-            ProtObjPerm.query.filter_by(
-                protected_object_id=game.protected_object.id,
-                protected_object_action_id=act_id).delete()
-            db.session.delete(game)
-            db.session.delete(game.protected_object)
-
-        db.session.delete(self.get_dao())
+        remove_rounds(DAO.query.filter_by(tournament_name=self.tournament_name,
+                                          ordering=self.ordering))
         if commit:
             db.session.commit()
 
-
     def destroy_draw(self):
         """
         Removes the draw for the round.
+
+        Nothing is removed if any game, other than a BYE, has a score.
         """
         rnd = self.get_dao()
+        if len(scored_rounds([rnd.id])):
+            raise DrawException()
 
-        for game in TournamentGame.query.filter_by(tournament_round_id=rnd.id).\
-        all():
-            if game.score_entered and len(game.entrants.all()) > 1: # not a BYE
-                raise DrawException()
+        if remove_games([rnd.id]):
+            bump_draw_versions([rnd])
+        clear_table_allocations(self.tournament_name, [self.ordering])
+        db.session.commit()
 
-            for game_entrant in game.entrants:
-                PermissionsChecker().remove_permission(
-                    game_entrant.entrant.player_id,
-                    PERMISSIONS['ENTER_SCORE'],
-                    game.protected_object)
-            game.entrants.delete()
+    def get_draw(self):
+        """
+        Get the draw for the round as written to the db. This is served from
+        DRAW_CACHE unless the draw has changed since it was read.
 
-        TournamentGame.query.filter_by(tournament_round_id=rnd.id).delete()
-        db.session.commit()
+        Returns: A list of dicts, ordered by table_number:
+            [{'table_number': 1, 'entrants': ['player_1', 'BYE']}]
+        """
+        rnd = self.get_dao()
+        key = (self.tournament_name, self.ordering)
+        version, draw = DRAW_CACHE.get(key, (None, None))
+        if version == (rnd.id, rnd.draw_version):
+            return draw
+
+        entrants = db.session.query(TournamentGame.table_num,
+                                    TournamentEntry.player_id).\
+            outerjoin(GameEntrant, GameEntrant.game_id == TournamentGame.id).\
+            outerjoin(TournamentEntry,
+                      TournamentEntry.id == GameEntrant.entrant_id).\
+            filter(TournamentGame.tournament_round_id == rnd.id).\
+            order_by(TournamentGame.table_num, GameEntrant.entrant_id)
+
+        draw = []
+        for table_num, player_id in entrants:
+            if not draw or draw[-1]['table_number'] != table_num:
+                draw.append({'table_number': table_num, 'entrants': []})
+            if player_id is not None:
+                draw[-1]['entrants'].append(player_id)
+        for table in draw:
+            if len(table['entrants']) == 1:
+                table['entrants'].append('BYE')
+
+        DRAW_CACHE[key] = ((rnd.id, rnd.draw_version), draw)
+        return draw
 
     def get_dao(self):
         """Convenience method to get the DAO"""
@@ -84,40 +365,22 @@ class TournamentRound(object):
             and_(DAO.ordering == self.ordering,
                  TournamentGame.table_num == table_num)).first()
 
-    def make_draw(self, entries):
-        """Determines the draw for round. This draw is written to the db"""
+    def make_draw(self, entries, match_ups=None):
+        """
+        Determines the draw for round. This draw is written to the db
+
+        match_ups can be passed in when the pairings for the round are already
+        known, e.g. from a matching strategy's schedule.
+        """
 
         rnd = self.get_dao()
 
-        match_ups = self.matching_strategy.match(rnd.ordering, entries)
-        self.draw = self.table_strategy.determine_tables(match_ups)
-        for match in self.draw:
-
-            entrants = [None if x == 'BYE' else x for x in match.entrants]
-
-            game = TournamentGame.query.filter_by(
-                tournament_round_id=rnd.id,
-                table_num=match.table_number).first()
-            if game is None:
-                game = TournamentGame(rnd.id, match.table_number)
-                db.session.add(game)
-                db.session.flush()
-
-            for entrant in entrants:
-                if entrant is not None:
-                    dao = TournamentEntry.query.\
-                        filter_by(id=entrant.id).first()
-                    game_entrant = GameEntrant.query.filter_by(
-                        game_id=game.id, entrant_id=dao.id).first()
-                    if game_entrant is None:
-                        db.session.add(GameEntrant(game.id, dao.id))
-                        PermissionsChecker().add_permission(
-                            dao.player_id,
-                            PERMISSIONS['ENTER_SCORE'],
-                            game.protected_object)
-                else:
-                    # The person playing the bye gets no points at the time
-                    game.score_entered = True
-                    db.session.add(game)
+        if match_ups is None:
+            match_ups = self.matching_strategy.match(rnd.ordering, entries)
+        history = TableHistory(
+            entries, get_table_history(self.tournament_name, self.ordering))
+        self.draw = self.table_strategy.determine_tables(match_ups, history)
+        if write_draws(self.tournament_name, [(rnd, self.draw)]):
+            bump_draw_versions([rnd])
 
         db.session.commit()
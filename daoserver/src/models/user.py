@@ -11,6 +11,7 @@ from models.dao.account import db, Account, AccountSecurity
 from models.dao.tournament import Tournament as TournDAO
 from models.dao.tournament_entry import TournamentEntry
 from models.permissions import PERMISSIONS
+from models.request_memo import get_memo
 from models.tournament import all_tournaments_with_permission, Tournament
 
 # pylint: disable=no-member
@@ -37,7 +38,8 @@ class User(object):
 
     def get_dao(self):
         """Convenience method to recover DAO"""
-        return Account.query.filter_by(username=self.username).first()
+        return get_memo(('account', self.username),
+                        Account.query.filter_by(username=self.username).first)
 
     def create(self, details):
         """Add an account"""
@@ -0,0 +1,441 @@
+"""
+Maximum weight matching in general graphs
+
+This is Edmonds' blossom algorithm with the primal-dual weight handling
+described by Galil ("Efficient algorithms for finding maximum matching in
+graphs", ACM Computing Surveys, 1986). It follows the well known
+implementation by Joris van Rantwijk and runs in O(n3) for n vertices.
+
+It is used to pair entries where a simple sort isn't enough, e.g. a Swiss
+draw that has to avoid rematches.
+"""
+# pylint: disable=invalid-name,too-many-locals,too-many-branches
+# pylint: disable=too-many-statements,too-many-nested-blocks
+
+def max_weight_matching(edges, max_cardinality=False):
+    """
+    Find a set of edges, no two sharing a vertex, with the greatest total
+    weight.
+
+    Expects:
+        edges - a list of (i, j, weight). Vertices are integers from 0. Weights
+            must be integers.
+        max_cardinality - when True only matchings with the most edges
+            possible are considered.
+    Returns:
+        A list where element v is the vertex matched with v, or -1.
+    """
+    if not edges:
+        return []
+
+    num_edges = len(edges)
+    num_vertices = 1 + max(max(i, j) for i, j, _ in edges)
+    max_weight = max([0] + [w for _, _, w in edges])
+
+    # Endpoint p of edge k is vertex endpoint[p] where k = p // 2
+    endpoint = [edges[p // 2][p % 2] for p in range(2 * num_edges)]
+
+    # The remote endpoints of the edges touching each vertex
+    neighbours = [[] for _ in range(num_vertices)]
+    for k, (i, j, _) in enumerate(edges):
+        neighbours[i].append(2 * k + 1)
+        neighbours[j].append(2 * k)
+
+    # mate[v] is the remote endpoint of v's matched edge, or -1
+    mate = num_vertices * [-1]
+
+    # Top-level blossoms (and vertices) are labelled 0 (free), 1 (S) or 2 (T).
+    # labelend is the endpoint through which the label was assigned.
+    label = (2 * num_vertices) * [0]
+    labelend = (2 * num_vertices) * [-1]
+
+    # Blossoms are numbered from num_vertices upwards
+    inblossom = list(range(num_vertices))
+    blossomparent = (2 * num_vertices) * [-1]
+    blossomchilds = (2 * num_vertices) * [None]
+    blossombase = list(range(num_vertices)) + num_vertices * [-1]
+    blossomendps = (2 * num_vertices) * [None]
+
+    # The least slack edges to neighbouring S-blossoms
+    bestedge = (2 * num_vertices) * [-1]
+    blossombestedges = (2 * num_vertices) * [None]
+
+    unusedblossoms = list(range(num_vertices, 2 * num_vertices))
+
+    # Vertex duals start at max_weight, blossom duals at 0
+    dualvar = num_vertices * [max_weight] + num_vertices * [0]
+
+    # Edges with zero slack that may be used in the search
+    allowedge = num_edges * [False]
+
+    queue = []
+
+    def slack(k):
+        """The slack of edge k. Doubled so it stays integral."""
+        i, j, wt = edges[k]
+        return dualvar[i] + dualvar[j] - 2 * wt
+
+    def blossom_leaves(b):
+        """Generate the vertices in blossom b"""
+        if b < num_vertices:
+            yield b
+        else:
+            for t in blossomchilds[b]:
+                if t < num_vertices:
+                    yield t
+                else:
+                    for v in blossom_leaves(t):
+                        yield v
+
+    def assign_label(w, t, p):
+        """Label vertex w, and its blossom, t via endpoint p"""
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(blossom_leaves(b))
+        elif t == 2:
+            # The base of a T-blossom is matched. Label its mate S.
+            base = blossombase[b]
+            assign_label(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scan_blossom(v, w):
+        """
+        Trace back from v and w to find a new blossom or an augmenting path.
+        Returns the base of the new blossom or -1 for a path.
+        """
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                # The root of an alternating tree
+                v = -1
+            else:
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def add_blossom(base, k):
+        """Make a new blossom from edge k and the paths to base"""
+        v, w, _ = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+
+        # T-vertices inside become S-vertices
+        for v in blossom_leaves(b):
+            if label[inblossom[v]] == 2:
+                queue.append(v)
+            inblossom[v] = b
+
+        # Work out the new blossom's least slack edges to S-blossoms
+        bestedgeto = (2 * num_vertices) * [-1]
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblists = [[p // 2 for p in neighbours[v]] \
+                           for v in blossom_leaves(bv)]
+            else:
+                nblists = [blossombestedges[bv]]
+            for nblist in nblists:
+                for edge in nblist:
+                    i, j, _ = edges[edge]
+                    if inblossom[j] == b:
+                        i, j = j, i
+                    bj = inblossom[j]
+                    if bj != b and label[bj] == 1 and (bestedgeto[bj] == -1 \
+                    or slack(edge) < slack(bestedgeto[bj])):
+                        bestedgeto[bj] = edge
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        blossombestedges[b] = [k for k in bestedgeto if k != -1]
+
+        bestedge[b] = -1
+        for edge in blossombestedges[b]:
+            if bestedge[b] == -1 or slack(edge) < slack(bestedge[b]):
+                bestedge[b] = edge
+
+    def expand_blossom(b, endstage):
+        """Break blossom b back into its sub-blossoms"""
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < num_vertices:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                expand_blossom(s, endstage)
+            else:
+                for v in blossom_leaves(s):
+                    inblossom[v] = s
+
+        # Mid-stage expansion of a T-blossom relabels its children
+        if not endstage and label[b] == 2:
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                jstep = -1
+                endptrick = 1
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[
+                    blossomendps[b][j - endptrick] ^ endptrick ^ 1]] = 0
+                assign_label(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+            j += jstep
+
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                reached = None
+                for v in blossom_leaves(bv):
+                    if label[v] != 0:
+                        reached = v
+                        break
+                if reached is not None:
+                    label[reached] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    assign_label(reached, 2, labelend[reached])
+                j += jstep
+
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augment_blossom(b, v):
+        """Swap matched and unmatched edges in b so that v becomes the base"""
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= num_vertices:
+            augment_blossom(t, v)
+
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep = 1
+            endptrick = 0
+        else:
+            jstep = -1
+            endptrick = 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= num_vertices:
+                augment_blossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= num_vertices:
+                augment_blossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augment_matching(k):
+        """Swap matched and unmatched edges along the path through edge k"""
+        v, w, _ = edges[k]
+        for s, p in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = inblossom[s]
+                if bs >= num_vertices:
+                    augment_blossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    # Reached the root of the tree
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= num_vertices:
+                    augment_blossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    # Each stage grows the matching by one edge or proves it is optimal
+    for _ in range(num_vertices):
+        label[:] = (2 * num_vertices) * [0]
+        bestedge[:] = (2 * num_vertices) * [-1]
+        blossombestedges[num_vertices:] = num_vertices * [None]
+        allowedge[:] = num_edges * [False]
+        queue[:] = []
+
+        for v in range(num_vertices):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assign_label(v, 1, -1)
+
+        augmented = False
+        while True:
+            while queue and not augmented:
+                v = queue.pop()
+                for p in neighbours[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if inblossom[v] == inblossom[w]:
+                        continue
+                    if not allowedge[k]:
+                        kslack = slack(k)
+                        if kslack <= 0:
+                            allowedge[k] = True
+                    if allowedge[k]:
+                        if label[inblossom[w]] == 0:
+                            assign_label(w, 2, p ^ 1)
+                        elif label[inblossom[w]] == 1:
+                            base = scan_blossom(v, w)
+                            if base >= 0:
+                                add_blossom(base, k)
+                            else:
+                                augment_matching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[inblossom[w]] == 1:
+                        b = inblossom[v]
+                        if bestedge[b] == -1 or kslack < slack(bestedge[b]):
+                            bestedge[b] = k
+                    elif label[w] == 0:
+                        if bestedge[w] == -1 or kslack < slack(bestedge[w]):
+                            bestedge[w] = k
+
+            if augmented:
+                break
+
+            # No augmenting path with the current duals. Find the smallest
+            # dual change that allows progress.
+            deltatype = -1
+            delta = deltaedge = deltablossom = None
+
+            if not max_cardinality:
+                deltatype = 1
+                delta = min(dualvar[:num_vertices])
+
+            for v in range(num_vertices):
+                if label[inblossom[v]] == 0 and bestedge[v] != -1:
+                    d = slack(bestedge[v])
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 2
+                        deltaedge = bestedge[v]
+
+            for b in range(2 * num_vertices):
+                if blossomparent[b] == -1 and label[b] == 1 and \
+                bestedge[b] != -1:
+                    d = slack(bestedge[b]) // 2
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 3
+                        deltaedge = bestedge[b]
+
+            for b in range(num_vertices, 2 * num_vertices):
+                if blossombase[b] >= 0 and blossomparent[b] == -1 and \
+                label[b] == 2 and (deltatype == -1 or dualvar[b] < delta):
+                    delta = dualvar[b]
+                    deltatype = 4
+                    deltablossom = b
+
+            if deltatype == -1:
+                # Only possible with max_cardinality. The matching is as big
+                # as it can be, so finish off the duals.
+                deltatype = 1
+                delta = max(0, min(dualvar[:num_vertices]))
+
+            for v in range(num_vertices):
+                if label[inblossom[v]] == 1:
+                    dualvar[v] -= delta
+                elif label[inblossom[v]] == 2:
+                    dualvar[v] += delta
+            for b in range(num_vertices, 2 * num_vertices):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+
+            if deltatype == 1:
+                # Optimal
+                break
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                i, j, _ = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                i, j, _ = edges[deltaedge]
+                queue.append(i)
+            else:
+                expand_blossom(deltablossom, False)
+
+        if not augmented:
+            break
+
+        # End of stage. Expand S-blossoms whose dual has reached zero.
+        for b in range(num_vertices, 2 * num_vertices):
+            if blossomparent[b] == -1 and blossombase[b] >= 0 and \
+            label[b] == 1 and dualvar[b] == 0:
+                expand_blossom(b, True)
+
+    return [endpoint[p] if p >= 0 else -1 for p in mate]
@@ -1,7 +1,10 @@
 """
 Basic class for test cases
 """
+from contextlib import contextmanager
+
 from flask_testing import TestCase
+from sqlalchemy import event
 
 from app import create_app
 from models.dao.db_connection import db
@@ -22,3 +25,18 @@ class AppSimulatingTest(TestCase):
     def tearDown(self):
         self.injector.delete()
         db.session.remove()
+
+    @contextmanager
+    def record_statements(self):
+        """
+        Record the SQL statements run inside the with block. Yields the list
+        they are appended to.
+        """
+        statements = []
+        def record(*args): # pylint: disable=unused-argument
+            statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
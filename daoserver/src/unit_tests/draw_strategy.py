@@ -3,13 +3,30 @@ Draw strategy unit tests
 """
 # pylint: disable=invalid-name,missing-docstring
 
-from testfixtures import compare
+import random
+import sys
 
-from models.matching_strategy import RoundRobin
+from testfixtures import Replace, compare
+
+from models.matching_strategy import BYE, RoundRobin, Swiss
+from models.weighted_matching import max_weight_matching
 from models.tournament import Tournament
 
 from unit_tests.app_simulating_test import AppSimulatingTest
 
+class Standings(object):
+    """Rank entries by the total_score they already have"""
+
+    @staticmethod
+    def overall_ranking(entries):
+        entries.sort(key=lambda x: x.total_score, reverse=True)
+        return entries
+
+class Entry(object):
+    def __init__(self, entry_id, total_score):
+        self.id = entry_id
+        self.total_score = total_score
+
 class DrawStrategyTests(AppSimulatingTest):
     """Tests for `matching_strategy.py`."""
 
@@ -26,7 +43,7 @@ class DrawStrategyTests(AppSimulatingTest):
         compare(draw[1][0].player_id, 'dst_player_2')
         compare(draw[1][1].player_id, 'dst_player_4')
         compare(draw[2][0].player_id, 'dst_player_3')
-        compare(draw[2][1], 'BYE')
+        compare(draw[2][1], BYE)
 
         draw = matching_strategy.match(2, entries)
         compare(draw[0][0].player_id, 'dst_player_5')
@@ -34,7 +51,7 @@ class DrawStrategyTests(AppSimulatingTest):
         compare(draw[1][0].player_id, 'dst_player_1')
         compare(draw[1][1].player_id, 'dst_player_3')
         compare(draw[2][0].player_id, 'dst_player_2')
-        compare(draw[2][1], 'BYE')
+        compare(draw[2][1], BYE)
 
         draw = matching_strategy.match(3, entries)
         compare(draw[0][0].player_id, 'dst_player_4')
@@ -42,7 +59,7 @@ class DrawStrategyTests(AppSimulatingTest):
         compare(draw[1][0].player_id, 'dst_player_5')
         compare(draw[1][1].player_id, 'dst_player_2')
         compare(draw[2][0].player_id, 'dst_player_1')
-        compare(draw[2][1], 'BYE')
+        compare(draw[2][1], BYE)
 
         draw = matching_strategy.match(4, entries)
         compare(draw[0][0].player_id, 'dst_player_3')
@@ -50,7 +67,7 @@ class DrawStrategyTests(AppSimulatingTest):
         compare(draw[1][0].player_id, 'dst_player_4')
         compare(draw[1][1].player_id, 'dst_player_1')
         compare(draw[2][0].player_id, 'dst_player_5')
-        compare(draw[2][1], 'BYE')
+        compare(draw[2][1], BYE)
 
         draw = matching_strategy.match(5, entries)
         compare(draw[0][0].player_id, 'dst_player_2')
@@ -58,7 +75,7 @@ class DrawStrategyTests(AppSimulatingTest):
         compare(draw[1][0].player_id, 'dst_player_3')
         compare(draw[1][1].player_id, 'dst_player_5')
         compare(draw[2][0].player_id, 'dst_player_4')
-        compare(draw[2][1], 'BYE')
+        compare(draw[2][1], BYE)
 
         draw = matching_strategy.match(6, entries)
         compare(draw[0][0].player_id, 'dst_player_1')
@@ -66,4 +83,89 @@ class DrawStrategyTests(AppSimulatingTest):
         compare(draw[1][0].player_id, 'dst_player_2')
         compare(draw[1][1].player_id, 'dst_player_4')
         compare(draw[2][0].player_id, 'dst_player_3')
-        compare(draw[2][1], 'BYE')
+        compare(draw[2][1], BYE)
+
+    def test_schedule(self):
+        """Everyone plays everyone else exactly once"""
+        for num_entries in range(1, 12):
+            entries = range(num_entries)
+            rounds = list(RoundRobin().schedule(num_entries + 2, entries))
+            compare(rounds[2], RoundRobin().match(3, entries))
+
+            num_rounds = num_entries if num_entries % 2 else num_entries - 1
+            games = [frozenset(x) for draw in rounds[:num_rounds] \
+                for x in draw]
+            compare(len(set(games)), len(games))
+            compare(len([x for x in games if BYE not in x]),
+                    num_entries * (num_entries - 1) / 2)
+            for draw in rounds:
+                compare(sorted(x for game in draw for x in game \
+                    if x is not BYE), entries)
+
+        # Rounds are generated one at a time, when asked for, without
+        # recursion, so a field bigger than the recursion limit is fine
+        entries = range(sys.getrecursionlimit() * 2)
+        schedule = RoundRobin().schedule(len(entries) - 1, entries)
+        compare(next(schedule), RoundRobin().match(1, entries))
+        compare(len(next(schedule)), len(entries) / 2)
+
+    def test_swiss(self):
+        """Swiss pairs by standings and avoids rematches"""
+        self.injector.inject('swiss', num_players=5)
+        tourn = Tournament('swiss')
+        tourn.matching_strategy = Swiss(tourn.ranking_strategy)
+        tourn.update({'rounds': 3})
+        self.assertFalse(tourn.matching_strategy.DRAW_FOR_ALL_ROUNDS)
+
+        # Everyone is level so the standings are in entry order
+        draw = tourn.matching_strategy.match(1, tourn.get_entries())
+        compare([(x.player_id, y if y is BYE else y.player_id) \
+            for x, y in draw],
+                [('swiss_player_1', 'swiss_player_2'),
+                 ('swiss_player_3', 'swiss_player_4'),
+                 ('swiss_player_5', BYE)])
+
+        games = []
+        for rnd in range(1, 4):
+            tourn_round = tourn.get_round(rnd)
+            tourn_round.make_draw(tourn.get_entries())
+            games.extend([frozenset([x if x is BYE else x.player_id \
+                for x in table.entrants]) for table in tourn_round.draw])
+        compare(len(games), 9)
+        compare(len(set(games)), 9)
+
+    def test_swiss_large(self):
+        """
+        256 entries on distinct totals are drawn from a window of the
+        standings, not the full graph of every possible game
+        """
+        rand = random.Random(0)
+        entries = [Entry(x, rand.random() * 100) for x in range(256)]
+        opponents = {x.id: [] for x in entries}
+        for _ in range(3):
+            ids = [x.id for x in entries]
+            rand.shuffle(ids)
+            for i, j in zip(ids[::2], ids[1::2]):
+                opponents[i].append(j)
+                opponents[j].append(i)
+
+        swiss = Swiss(Standings())
+        swiss.get_opponents = lambda entries, round_to_draw: opponents
+        graphs = []
+        def matching(edges, **kwargs):
+            graphs.append(len(edges))
+            return max_weight_matching(edges, **kwargs)
+        with Replace('models.matching_strategy.max_weight_matching',
+                     matching):
+            draw = swiss.match(4, entries)
+        # One matching over the first window, 2 * 4 + 4 places either side
+        compare(graphs, [sum(min(12, 255 - x) for x in range(256))])
+
+        compare(len(draw), 128)
+        compare(len(set(x.id for pair in draw for x in pair)), 256)
+        compare([x for x, y in draw if y.id in opponents[x.id]], [])
+        # Nobody is drawn far from their place in the standings
+        places = {x.id: i for i, x in \
+            enumerate(Standings.overall_ranking(entries))}
+        self.assertTrue(
+            max(abs(places[x.id] - places[y.id]) for x, y in draw) < 10)
@@ -11,7 +11,7 @@ from models.dao.tournament_entry import TournamentEntry
 from models.dao.tournament_game import TournamentGame
 from models.dao.tournament_round import TournamentRound
 
-from models.score import Score
+from models.score import GameValidator, Score, write_scores
 from models.tournament import Tournament
 
 from unit_tests.app_simulating_test import AppSimulatingTest
@@ -82,6 +82,42 @@ class EnterScore(AppSimulatingTest):
                       category=self.cat_1.name, game_id=game_id)
         self.assertRaises(ValueError, score.write)
 
+    def test_enter_opponent_score(self):
+        """The entry is checked before its opponent is looked up"""
+        args = cat('sports', 10, False, 0, 5)
+        args['opponent_score'] = True
+        self.db.session.add(ScoreCategory(tournament_id=self.tourn_1, **args))
+        self.db.session.commit()
+        tourn = Tournament(self.tourn_1)
+        tourn.make_draws()
+
+        entry = TournamentEntry.query.filter_by(
+            player_id=self.player, tournament_id=self.tourn_1).first()
+        game = TournamentGame.query.join(GameEntrant).\
+            filter(GameEntrant.entrant_id == entry.id).first()
+        opponent = [x.entrant_id for x in game.entrants \
+            if x.entrant_id != entry.id][0]
+        outsider = TournamentEntry.query.filter(and_(
+            TournamentEntry.tournament_id == self.tourn_1,
+            ~TournamentEntry.id.in_([x.entrant_id for x in game.entrants]))).\
+            first()
+
+        for entry_id in [-1, outsider.id]:
+            self.assertRaises(ValueError, write_scores, tourn, entry_id,
+                              [{'category': 'sports', 'game_id': game.id,
+                                'score': 3}])
+        self.assertRaises(ValueError, Score(
+            category='sports', tournament=tourn, game_id=game.id,
+            entry_id=outsider.id, score=3).write)
+        compare(GameScore.query.filter_by(game_id=game.id).all(), [])
+
+        # Score.write goes through write_scores so the opponent is scored
+        Score(category='sports', tournament=tourn, game_id=game.id,
+              entry_id=entry.id, score=3).write()
+        compare([(x.entry_id, x.score.value) for x in \
+            GameScore.query.filter_by(game_id=game.id).all()],
+                [(opponent, 3)])
+
     def test_enter_score_cleanup(self):
         """make sure no scores are added accidentally"""
         game_scores = len(GameScore.query.all())
@@ -91,3 +127,40 @@ class EnterScore(AppSimulatingTest):
 
         compare(game_scores, len(GameScore.query.all()))
         compare(scores, len(ScoreDAO.query.all()))
+
+    def test_game_validator(self):
+        """A game's scores are checked without going back to the db"""
+        battle = ScoreCategory(tournament_id=self.tourn_1,
+                               **cat('battle', 50, False, 0, 20, True))
+        self.db.session.add(battle)
+        self.db.session.commit()
+        tourn = Tournament(self.tourn_1)
+        tourn.make_draws()
+
+        game = TournamentGame.query.join(GameEntrant).\
+            filter(GameEntrant.entrant_id == TournamentEntry.query.filter_by(
+                player_id=self.player).first().id).first()
+        entry_1, entry_2 = sorted(x.entrant_id for x in game.entrants)
+        Score(category='battle', tournament=tourn, game_id=game.id,
+              entry_id=entry_1, score=12).write()
+
+        validator = GameValidator.load([game])[game.id]
+        battle, per_round = [ScoreCategory.query.filter_by(
+            tournament_id=self.tourn_1, name=x).first() \
+            for x in ['battle', 'per_round']]
+        with self.record_statements() as statements:
+            compare(validator.opponent(entry_1).id, entry_2)
+            # zero sum
+            self.assertRaises(ValueError, validator.validate, entry_2, battle,
+                              9)
+            validator.add(entry_2, battle, 8)
+            # already entered
+            self.assertRaises(ValueError, validator.validate, entry_1, battle,
+                              1)
+            self.assertRaises(ValueError, validator.validate, entry_2, battle,
+                              1)
+            # out of range
+            self.assertRaises(ValueError, validator.validate, entry_1,
+                              per_round, 101)
+            validator.validate(entry_1, per_round, 100)
+        compare(statements, [])
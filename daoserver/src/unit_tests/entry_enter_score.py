@@ -14,6 +14,7 @@ from models.dao.tournament_round import TournamentRound
 
 from models.score import Score
 from models.tournament import Tournament
+from models.tournament_entry import TournamentEntry as Entry
 
 from unit_tests.app_simulating_test import AppSimulatingTest
 from unit_tests.tournament_injector import score_cat_args as cat
@@ -73,23 +74,22 @@ class TestScoreEntered(AppSimulatingTest):
 
     def test_no_scores(self):
         """
-        There should be an error when you check a game before score categories \
-        are assigned to it.
+        A game isn't complete before score categories are assigned to it
         """
         entry_1_id = TournamentEntry.query.filter_by(
             player_id='{}_player_{}'.format(self.tourn_1, 1),
             tournament_id=self.tourn_1).first().id
         game = self.get_game_by_round(entry_1_id, 1)
-        self.assertRaises(AttributeError, Score.is_score_entered, game)
+        self.assertFalse(Score.is_score_entered(game))
 
 
     def test_score_entered(self):
         tourn = Tournament(self.tourn_1)
 
-        score_args = cat('per_round', 50, False, 0, 100)
-        cat_1 = ScoreCategory(tournament_id=self.tourn_1, **score_args)
-        self.db.session.add(cat_1)
-        self.db.session.flush()
+        tourn.update({'score_categories': [
+            cat('per_round', 50, False, 0, 100)]})
+        cat_1 = ScoreCategory.query.filter_by(tournament_id=self.tourn_1,
+                                              name='per_round').first()
 
         entry_2_id = TournamentEntry.query.filter_by(
             player_id='{}_player_{}'.format(self.tourn_1, 2),
@@ -298,3 +298,49 @@ class EnterScore(AppSimulatingTest):
         compare(game_scores, len(GameScore.query.all()))
         compare(tournament_scores, len(TournamentScore.query.all()))
         compare(scores, len(ScoreDAO.query.all()))
+
+    def test_set_scores(self):
+        """Several scores are entered together or not at all"""
+        tourn = Tournament(self.tourn_1)
+        tourn.make_draws()
+        entry = Entry(self.tourn_1, self.player)
+        games = [x.game_id for x in GameEntrant.query.join(TournamentGame).\
+            join(TournamentRound).filter(
+                GameEntrant.entrant_id == entry.entry_id).\
+            order_by(TournamentRound.ordering)]
+        count = len(ScoreDAO.query.all())
+
+        for scores in [
+                # The second is out of range
+                [{'category': 'per_tournament', 'score': 10},
+                 {'category': 'per_round', 'score': 101, 'game_id': games[0]}],
+                # The same score twice
+                [{'category': 'per_round', 'score': 1, 'game_id': games[0]},
+                 {'category': 'per_round', 'score': 2, 'game_id': games[0]}],
+                # Unknown category
+                [{'category': 'per_tournament', 'score': 10},
+                 {'category': 'foo', 'score': 1}],
+                # Missing game
+                [{'category': 'per_round', 'score': 1, 'game_id': 'foo'}]]:
+            self.assertRaises((ValueError, TypeError), entry.set_scores,
+                              scores)
+            compare(len(ScoreDAO.query.all()), count)
+
+        compare(entry.set_scores([
+            {'category': 'per_tournament', 'score': 10},
+            {'category': 'per_round', 'score': 15, 'game_id': games[0]},
+            {'category': 'per_round', 'score': 20, 'game_id': games[1]}]),
+                '\n'.join(['Score entered for {}: {}'.format(self.player, x) \
+                    for x in [10, 15, 20]]))
+        compare(sorted((x.score_category.name, x.value) for x in \
+            ScoreDAO.query.filter_by(entry_id=entry.entry_id)),
+                [('per_round', 15), ('per_round', 20),
+                 ('per_tournament', 10)])
+        compare(sorted((x.score_category.name, x.score, x.num_scores) \
+            for x in entry.get_dao().standings),
+                [('per_round', 35, 2), ('per_tournament', 10, 1)])
+        compare([TournamentGame.query.filter_by(id=x).first().\
+            scores_received for x in games], [1, 1])
+
+        self.assertRaises(ValueError, entry.set_scores,
+                          [{'category': 'per_tournament', 'score': 10}])
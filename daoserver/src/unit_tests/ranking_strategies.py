@@ -0,0 +1,291 @@
+"""
+Ranking strategy unit tests
+"""
+
+from decimal import Decimal as Dec
+import json
+import random
+
+from testfixtures import compare, Replace
+
+from models.dao.game_entry import GameEntrant
+from models.dao.score import ScoreCategory, Standing
+from models.dao.tournament_entry import TournamentEntry
+from models.dao.tournament_game import TournamentGame
+from models.dao.tournament_round import TournamentRound
+
+from models.ranking_strategies import AggregateRankingStrategy, \
+NumpyRankingStrategy, RankingStrategy, StandingsRankingStrategy, \
+TieBreakerRankingStrategy, rank_matrix, tie_breaker_columns
+from models.score import Score
+from models.tournament import Tournament
+from unit_tests.app_simulating_test import AppSimulatingTest
+from unit_tests.tournament_injector import score_cat_args as cat
+
+# pylint: disable=no-member,missing-docstring
+def get_game_id(tournament_name, entry_id, round_num):
+    return TournamentGame.query.join(GameEntrant).join(TournamentRound).\
+        filter(GameEntrant.entrant_id == entry_id,
+               TournamentRound.ordering == round_num,
+               TournamentRound.tournament_name == tournament_name).first().id
+
+class RankingStrategies(AppSimulatingTest):
+
+    tourn_1 = 'ranking_strategies'
+
+    def setUp(self):
+        super(RankingStrategies, self).setUp()
+        self.injector.inject(self.tourn_1, num_players=6)
+        self.db.session.add(ScoreCategory(tournament_id=self.tourn_1,
+                                          **cat('painting', 15, True, 0, 15)))
+        self.db.session.add(ScoreCategory(tournament_id=self.tourn_1,
+                                          **cat('battle', 70, False, 0, 20)))
+        self.db.session.add(ScoreCategory(tournament_id=self.tourn_1,
+                                          **cat('sports', 15, False, 1, 5)))
+        self.db.session.commit()
+
+        tourn = Tournament(self.tourn_1)
+        tourn.update({'rounds': 2})
+
+        entries = tourn.get_entries()
+        # The last entry gets no scores at all
+        for i, entry in enumerate(entries[:-1]):
+            if i % 2:
+                Score(tournament=tourn, entry_id=entry.id, category='painting',
+                      score=(i * 7) % 16).write()
+            for rnd in range(1, 3):
+                game_id = get_game_id(self.tourn_1, entry.id, rnd)
+                Score(tournament=tourn, entry_id=entry.id, game_id=game_id,
+                      category='battle', score=(i * 5 + rnd * 3) % 21).write()
+                if rnd == 1:
+                    Score(tournament=tourn, entry_id=entry.id, game_id=game_id,
+                          category='sports', score=i % 5 + 1).write()
+
+    def test_aggregate_matches_default(self):
+        tourn = Tournament(self.tourn_1)
+        default = RankingStrategy(self.tourn_1, tourn.get_score_categories)
+        aggregate = AggregateRankingStrategy(self.tourn_1,
+                                             tourn.get_score_categories)
+
+        expected = [(x.id, x.total_score, x.ranking) for x in \
+            default.overall_ranking(tourn.get_entries())]
+        compare([(x.id, x.total_score, x.ranking) for x in \
+            aggregate.overall_ranking(tourn.get_entries())], expected)
+        compare(len(set(x[1] for x in expected)), 6)
+        compare(expected[-1][1], 0)
+
+        for entry in tourn.get_entries():
+            compare(aggregate.total_score(entry), default.total_score(entry))
+
+    def test_category_totals(self):
+        tourn = Tournament(self.tourn_1)
+        aggregate = AggregateRankingStrategy(self.tourn_1,
+                                             tourn.get_score_categories)
+        entry = tourn.get_entries()[1]
+        categories = dict((x.id, x.name) for x in \
+            tourn.get_score_categories())
+
+        compare([(categories[x[1]], x[2], x[3], x[4]) for x in \
+            aggregate.get_category_totals() if x[0] == entry.id],
+                [('painting', 7, 15, 7.0 / 15 * 15),
+                 ('battle', 19, 40, 19.0 / 40 * 70),
+                 ('sports', 2, 5, 2.0 / 5 * 15)])
+
+        # One entry's totals are read without totalling everyone else's
+        for strategy in [aggregate, StandingsRankingStrategy(
+                self.tourn_1, tourn.get_score_categories)]:
+            compare(strategy.get_category_totals([entry.id]),
+                    [x for x in strategy.get_category_totals() \
+                    if x[0] == entry.id])
+
+    def test_standings_match_default(self):
+        tourn = Tournament(self.tourn_1)
+        default = RankingStrategy(self.tourn_1, tourn.get_score_categories)
+        standings = StandingsRankingStrategy(self.tourn_1,
+                                             tourn.get_score_categories)
+        aggregate = AggregateRankingStrategy(self.tourn_1,
+                                             tourn.get_score_categories)
+
+        compare(standings.get_category_totals(),
+                aggregate.get_category_totals())
+        compare([(x.id, x.total_score, x.ranking) for x in \
+            standings.overall_ranking(tourn.get_entries())],
+                [(x.id, x.total_score, x.ranking) for x in \
+            default.overall_ranking(tourn.get_entries())])
+
+    def test_standings_categories(self):
+        tourn = Tournament(self.tourn_1)
+        entry = TournamentEntry.query.get(tourn.get_entries()[1].id)
+        compare(sorted((x.score_category.name, x.score, x.num_scores) \
+            for x in entry.standings),
+                [('battle', 19, 2), ('painting', 7, 1), ('sports', 2, 1)])
+
+        tourn.update({'score_categories': [
+            cat('battle', 70, False, 0, 20),
+            cat('sports', 30, False, 1, 10)]})
+        compare(sorted((x.score_category.name, x.score, x.num_scores) \
+            for x in entry.standings),
+                [('battle', 19, 2), ('sports', 2, 1)])
+        compare(Standing.query.join(ScoreCategory).filter(
+            ScoreCategory.name == 'painting').count(), 0)
+
+        standings = StandingsRankingStrategy(self.tourn_1,
+                                             tourn.get_score_categories)
+        compare(standings.total_score(entry),
+                19.0 / 40 * 70 + 2.0 / 10 * 30)
+
+    def test_entry_snapshot(self):
+        tourn = Tournament(self.tourn_1)
+        tourn.get_score_categories()
+        with self.record_statements() as statements:
+            entries = tourn.get_entries()
+            compare(len(statements), 3)
+            RankingStrategy(self.tourn_1, tourn.get_score_categories).\
+                overall_ranking(entries)
+            compare(len(statements), 3)
+
+        for entry in entries:
+            dao = TournamentEntry.query.get(entry.id)
+            compare(entry.player_id, dao.player_id)
+            compare(sorted((x.id, x.value, x.score_category.name) \
+                for x in entry.scores),
+                    sorted((x.id, x.value, x.score_category.name) \
+                for x in dao.scores))
+
+    def test_numpy_matches_default(self):
+        tourn = Tournament(self.tourn_1)
+        default = RankingStrategy(self.tourn_1, tourn.get_score_categories)
+        tourn.ranking_strategy = NumpyRankingStrategy(
+            self.tourn_1, tourn.get_score_categories)
+
+        compare([(x.id, x.total_score, x.ranking) for x in \
+            tourn.ranking_strategy.overall_ranking(tourn.get_entries())],
+                [(x.id, x.total_score, x.ranking) for x in \
+            default.overall_ranking(tourn.get_entries())])
+
+    def test_top_ranking(self):
+        tourn = Tournament(self.tourn_1)
+        for strategy in [RankingStrategy, AggregateRankingStrategy,
+                         StandingsRankingStrategy, NumpyRankingStrategy]:
+            strategy = strategy(self.tourn_1, tourn.get_score_categories)
+            expected = [(x.id, x.total_score, x.ranking) for x in \
+                strategy.overall_ranking(tourn.get_entries())]
+            for top in [0, 3, 6, 10]:
+                compare([(x.id, x.total_score, x.ranking) for x in \
+                    strategy.top_ranking(tourn.get_entries(), top)],
+                        expected[:top])
+
+        entries = tourn.get_entries(score_info=False)
+        self.assertTrue(entries[0].score_info is None)
+        tourn.add_score_info(entries[1:2])
+        compare(sorted(x['category'] for x in entries[1].score_info),
+                ['battle', 'battle', 'painting', 'sports'])
+        compare(tourn.get_entries()[1].score_info, entries[1].score_info)
+
+    def test_rankings_endpoint(self):
+        # Entries are ranked before their scores are loaded
+        tourn = Tournament(self.tourn_1)
+        expected = [[x.id, str(Dec(x.total_score).quantize(Dec('1.00')))] \
+            for x in RankingStrategy(self.tourn_1, tourn.get_score_categories).\
+            overall_ranking(tourn.get_entries())]
+        with Replace('models.tournament.StandingsRankingStrategy',
+                     RankingStrategy):
+            for query in ['', '?top=3', '?offset=2&limit=2']:
+                response = self.client.get('/tournament/{}/rankings{}'.\
+                    format(self.tourn_1, query))
+                self.assert200(response)
+                compare([[x['entry_id'], x['total_score']] \
+                    for x in json.loads(response.data)],
+                        expected[:3] if query == '?top=3' else \
+                        expected[2:4] if 'offset' in query else expected)
+
+    def test_rank_matrix(self):
+        totals, order = rank_matrix([[1, 2], [0, 0], [3, 4], [1, 2]],
+                                    [[5, 5], [0, 0], [5, 5], [5, 5]],
+                                    [50, 50])
+        compare(totals.tolist(), [30.0, 0.0, 70.0, 30.0])
+        compare(order.tolist(), [2, 0, 3, 1])
+
+        rand = random.Random(0)
+        size = 10000
+        scores = [[rand.randint(0, 100), rand.randint(0, 20)] \
+            for _ in range(size)]
+        totals, order = rank_matrix(scores, [[100, 20]] * size, [80, 20])
+        # A stable sort from highest total to lowest, so ties keep their order
+        compare(order.tolist(),
+                sorted(range(size), key=lambda x: -totals[x]))
+
+
+class TieBreakers(AppSimulatingTest):
+
+    tourn_1 = 'tie_breakers'
+
+    def setUp(self):
+        super(TieBreakers, self).setUp()
+        self.injector.inject(self.tourn_1, num_players=4)
+        self.db.session.add(ScoreCategory(tournament_id=self.tourn_1,
+                                          **cat('battle', 100, False, 0, 20)))
+        self.db.session.commit()
+
+        tourn = Tournament(self.tourn_1)
+        tourn.update({'rounds': 2})
+        self.entries = tourn.get_entries()
+
+        # Round 1: 1 beats 3, 2 draws 4. Round 2: 3 beats 2, 4 beats 1.
+        # 1 & 4 finish on 16 and 2 & 3 on 15.
+        results = [(1, [(0, 10, 2, 6), (1, 8, 3, 8)]),
+                   (2, [(2, 9, 1, 7), (3, 8, 0, 6)])]
+        for rnd, games in results:
+            for entry, score, opponent, opponent_score in games:
+                game_id = get_game_id(self.tourn_1, self.entries[entry].id,
+                                      rnd)
+                compare(sorted(x.entrant_id for x in \
+                    GameEntrant.query.filter_by(game_id=game_id)),
+                        sorted([self.entries[entry].id,
+                                self.entries[opponent].id]))
+                for i, points in [(entry, score), (opponent, opponent_score)]:
+                    Score(tournament=tourn, entry_id=self.entries[i].id,
+                          game_id=game_id, category='battle',
+                          score=points).write()
+
+    def ranking(self, tie_breakers=None):
+        tourn = Tournament(self.tourn_1)
+        strategy = TieBreakerRankingStrategy(
+            self.tourn_1, tourn.get_score_categories, tie_breakers)
+        ids = [x.id for x in self.entries]
+        return [ids.index(x.id) for x in \
+            strategy.overall_ranking(tourn.get_entries())]
+
+    def test_tie_breakers(self):
+        # Level on strength of schedule so opponents' win % decides
+        compare(self.ranking(), [0, 3, 1, 2])
+        compare(self.ranking(['head_to_head']), [3, 0, 2, 1])
+        compare(self.ranking(['win_percentage']), [3, 0, 2, 1])
+        self.assertRaises(ValueError, self.ranking, ['coin_toss'])
+
+        tourn = Tournament(self.tourn_1)
+        entries = TieBreakerRankingStrategy(
+            self.tourn_1, tourn.get_score_categories).\
+            overall_ranking(tourn.get_entries())
+        compare([x.ranking for x in entries], [1, 2, 3, 4])
+        compare([x.id for x in TieBreakerRankingStrategy(
+            self.tourn_1, tourn.get_score_categories).\
+            top_ranking(tourn.get_entries(), 2)], [x.id for x in entries[:2]])
+        compare(entries[0].tie_breakers, {'strength_of_schedule': 38.75,
+                                          'opponents_win_percentage': 0.625,
+                                          'head_to_head': 0.0})
+
+    def test_tie_breaker_columns(self):
+        # 0 beat 1, 1 drew 2 and 2's game with 0 is not scored yet
+        columns = tie_breaker_columns(
+            [10, 10, 5],
+            [(0, 1), (1, 0), (1, 2), (2, 1), (0, 2), (2, 0)],
+            [1, 0, 0.5, 0.5, float('nan'), float('nan')])
+        compare(columns['win_percentage'].tolist(), [1.0, 0.25, 0.5])
+        compare(columns['strength_of_schedule'].tolist(), [7.5, 7.5, 10.0])
+        compare(columns['opponents_win_percentage'].tolist(),
+                [0.375, 0.75, 0.625])
+        compare(columns['head_to_head'].tolist(), [1.0, 0.0, 0.0])
+
+        columns = tie_breaker_columns([], [], [])
+        compare(columns['head_to_head'].tolist(), [])
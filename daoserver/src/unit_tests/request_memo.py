@@ -0,0 +1,41 @@
+"""
+Test the request scoped memo of DAO lookups
+"""
+
+from testfixtures import compare
+
+from models.tournament import Tournament
+from models.user import User
+from unit_tests.app_simulating_test import AppSimulatingTest
+
+# pylint: disable=no-member,missing-docstring
+class RequestMemo(AppSimulatingTest):
+
+    tourn_1 = 'request_memo'
+
+    def setUp(self):
+        super(RequestMemo, self).setUp()
+        self.injector.inject(self.tourn_1, num_players=2)
+
+    def test_memo(self):
+        tourn = Tournament(self.tourn_1)
+        dao = tourn.get_dao()
+        with self.record_statements() as statements:
+            self.assertTrue(Tournament(self.tourn_1).get_dao() is dao)
+            tourn.details()
+        compare(len([x for x in statements if 'FROM tournament ' in x]), 0)
+
+        # A commit forgets them
+        self.db.session.commit()
+        with self.record_statements() as statements:
+            tourn.get_dao()
+            tourn.get_dao()
+        compare(len(statements), 1)
+
+        # Missing DAOs aren't remembered
+        user = User('{}_player_1'.format(self.tourn_1))
+        with self.record_statements() as statements:
+            self.assertTrue(Tournament('not_a_tournament').get_dao() is None)
+            self.assertTrue(Tournament('not_a_tournament').get_dao() is None)
+            self.assertTrue(user.get_dao() is User(user.username).get_dao())
+        compare(len(statements), 2)
@@ -2,11 +2,15 @@
 The process by which players are allocated to tables
 """
 
+import itertools
+import random
 import unittest
 from testfixtures import compare
 
 from models.dao.tournament_entry import TournamentEntry
-from models.table_strategy import ProtestAvoidanceStrategy, Table
+from models.matching_strategy import BYE
+from models.table_strategy import MinCostAssignmentStrategy, \
+ProtestAvoidanceStrategy, Table, TableHistory, min_cost_assignment
 
 class TableStrategyTests(unittest.TestCase):             # pylint: disable=R0904
     """Tests for `table_strategy_strategy.py`."""
@@ -112,3 +116,197 @@ class TableStrategyTests(unittest.TestCase):             # pylint: disable=R0904
         compare(draw[0].entrants, [entry1, entry2])
         compare(draw[2].entrants, [entry3, entry4])
         compare(draw[1].entrants, [entry5, entry6])
+
+    def test_min_cost_assignment(self):
+        """The assignment should be the cheapest of all permutations"""
+        rand = random.Random(42)
+        for size in range(1, 7):
+            costs = [[rand.randint(0, 9) for _ in range(size)] \
+                for _ in range(size)]
+            cheapest = min(
+                sum(costs[i][j] for i, j in enumerate(perm)) \
+                for perm in itertools.permutations(range(size)))
+
+            assignment = min_cost_assignment(costs)
+            compare(sorted(assignment), range(size))
+            compare(sum(costs[i][j] for i, j in enumerate(assignment)),
+                    cheapest)
+
+        compare(min_cost_assignment([]), [])
+        compare(min_cost_assignment([[0, 0], [0, 0]]), [0, 1])
+
+    def test_assignment_layouts(self):
+        """
+        The assignment strategy should agree with the exhaustive strategy
+        """
+        entry1 = TournamentEntry('entry1', 'foo', game_history=[1, 2])
+        entry2 = TournamentEntry('entry2', 'foo', game_history=[2, 1])
+        entry3 = TournamentEntry('entry3', 'foo', game_history=[3, 2])
+        entry4 = TournamentEntry('entry4', 'foo', game_history=[1, 3])
+        entry5 = TournamentEntry('entry5', 'foo', game_history=[2, 3])
+        entry6 = TournamentEntry('entry6', 'foo', game_history=[3, 1])
+        games = [(entry1, entry2), (entry3, entry4), (entry5, entry6)]
+        strategy = MinCostAssignmentStrategy()
+
+        draw = strategy.determine_tables(games)
+        compare([x.table_number for x in draw], [1, 2, 3])
+        compare(ProtestAvoidanceStrategy.get_protest_score_for_layout(draw).\
+            total_protests(), 2)
+        compare(draw[2].entrants, [entry1, entry2])
+        # Of the two best layouts this one leaves the second game in place
+        compare(draw[1].entrants, [entry3, entry4])
+        compare(draw[0].entrants, [entry5, entry6])
+
+        # Games stay put when there is nothing to choose between layouts
+        draw = MinCostAssignmentStrategy().determine_tables(
+            [(TournamentEntry('a', 'foo', game_history=[]), BYE)])
+        compare(draw[0].table_number, 1)
+        compare(strategy.determine_tables([]), [])
+
+    def test_assignment_large_draw(self):
+        """Big draws should be quick and still avoid protests"""
+        entries = [TournamentEntry('entry{}'.format(i), 'foo',
+                                   game_history=[i / 2 + 1]) \
+                   for i in range(64)]
+        games = [(entries[i], entries[i + 1]) for i in range(0, 64, 2)]
+        games.reverse()
+
+        draw = MinCostAssignmentStrategy().determine_tables(games)
+        compare(len(draw), 32)
+        compare(ProtestAvoidanceStrategy.get_protest_score_for_layout(draw).\
+            total_protests(), 0)
+
+    def test_search_matches_exhaustive(self):
+        """Pruning shouldn't change which layout is chosen"""
+        rand = random.Random(7)
+        for num_games in range(1, 7):
+            entries = [
+                TournamentEntry('entry{}'.format(i), 'foo', game_history=[
+                    rand.randint(1, num_games) for _ in range(2)]) \
+                for i in range(num_games * 2)]
+            games = [(entries[i], entries[i + 1]) \
+                for i in range(0, len(entries), 2)]
+
+            # The first least protested permutation is the exhaustive answer
+            expected = min(
+                ([Table(i + 1, list(x)) for i, x in enumerate(perm)] \
+                 for perm in itertools.permutations(games)),
+                key=lambda x: ProtestAvoidanceStrategy.\
+                    get_protest_score_for_layout(x).total_protests())
+
+            draw, optimal = ProtestAvoidanceStrategy().search(games)
+            self.assertTrue(optimal)
+            compare([x.entrants for x in draw],
+                    [x.entrants for x in expected])
+
+    def test_search_early_exit(self):
+        """A layout with no protests is returned without looking further"""
+        entries = [TournamentEntry('entry{}'.format(i), 'foo',
+                                   game_history=[]) for i in range(20)]
+        games = [(entries[i], entries[i + 1]) for i in range(0, 20, 2)]
+
+        draw, optimal = ProtestAvoidanceStrategy(time_budget=0).search(games)
+        self.assertTrue(optimal)
+        compare([x.entrants for x in draw], [list(x) for x in games])
+
+    def test_search_time_budget(self):
+        """When time runs out the best layout so far is returned"""
+        entries = [TournamentEntry('entry{}'.format(i), 'foo',
+                                   game_history=[i / 2 + 1]) \
+                   for i in range(24)]
+        games = [(entries[i], entries[i + 1]) for i in range(0, 24, 2)]
+
+        draw, optimal = ProtestAvoidanceStrategy(time_budget=0).search(games)
+        self.assertFalse(optimal)
+        compare(len(draw), 12)
+
+        draw, optimal = ProtestAvoidanceStrategy(time_budget=5).search(games)
+        self.assertTrue(optimal)
+        compare(ProtestAvoidanceStrategy.get_protest_score_for_layout(draw).\
+            total_protests(), 0)
+
+    def test_search_multiple_entrants(self):
+        """Games can have more than two entrants"""
+        entry1 = TournamentEntry('entry1', 'foo', game_history=[1])
+        entry2 = TournamentEntry('entry2', 'foo', game_history=[1])
+        entry3 = TournamentEntry('entry3', 'foo', game_history=[1])
+        entry4 = TournamentEntry('entry4', 'foo', game_history=[2])
+        entry5 = TournamentEntry('entry5', 'foo', game_history=[3])
+        entry6 = TournamentEntry('entry6', 'foo', game_history=[3])
+        games = [(entry1, entry2, entry3), (entry4, entry5, entry6)]
+
+        result = ProtestAvoidanceStrategy.get_protest_score_for_layout(
+            [Table(1, list(games[0])), Table(2, list(games[1]))])
+        compare(result.protests, [0, 1, 0, 1])
+        compare(result.total_protests(), 4)
+
+        draw, optimal = ProtestAvoidanceStrategy().search(games)
+        self.assertTrue(optimal)
+        compare(draw[0].entrants, list(games[1]))
+        compare(draw[1].entrants, list(games[0]))
+
+    def test_assignment_objectives(self):
+        """Each objective should prefer a different kind of protest"""
+        entry1 = TournamentEntry('entry1', 'foo', game_history=[1])
+        entry2 = TournamentEntry('entry2', 'foo', game_history=[1, 2])
+        entry3 = TournamentEntry('entry3', 'foo', game_history=[1])
+        entry4 = TournamentEntry('entry4', 'foo', game_history=[])
+        games = [(entry1, entry2), (entry3, entry4)]
+
+        # Staying put gives a double protest, swapping gives two singles
+        def first_table(objective):
+            """Where the first game ends up"""
+            draw = MinCostAssignmentStrategy(objective).determine_tables(games)
+            return [x.table_number for x in draw \
+                if x.entrants == list(games[0])][0]
+        compare(first_table('utility'), 1)
+        compare(first_table('least_outrage'), 2)
+        compare(first_table('split'), 1)
+
+        # Now swapping is fewer protests overall but still two singles
+        entry4.game_history = [2]
+        compare(first_table('utility'), 2)
+        compare(first_table('least_outrage'), 2)
+        compare(first_table('split'), 1)
+
+        self.assertRaises(ValueError, MinCostAssignmentStrategy, 'foo')
+
+    def test_history_protests(self):
+        """The protest matrix should agree with Table.protest_score"""
+        rand = random.Random(3)
+        entries = [
+            TournamentEntry('entry{}'.format(i), 'foo', game_history=[
+                rand.randint(0, 8) for _ in range(3)]) for i in range(11)]
+        games = [[entries[i], entries[i + 1]] for i in range(0, 10, 2)]
+        games.append([entries[10], BYE])
+
+        protests = TableHistory(entries).get_protests(games)
+        compare(protests.tolist(), [
+            [Table(table + 1, game).protest_score() \
+             for table in range(len(games))] for game in games])
+
+    def test_table_history(self):
+        """Entries are looked up in the index. Anything else never protests"""
+        entry1 = TournamentEntry('entry1', 'foo', game_history=[1, 3])
+        entry2 = TournamentEntry('entry2', 'foo', game_history=[2, 3])
+        entry3 = TournamentEntry('entry3', 'foo', game_history=[])
+        history = TableHistory([entry1, entry2, entry3])
+
+        compare(history.count_protests([entry1, entry2], 3), 2)
+        compare(history.count_protests([entry1, entry2], 1), 1)
+        compare(history.count_protests([entry1, BYE], 1), 1)
+        compare(history.count_protests([entry3, BYE], 1), 0)
+        compare(history.count_protests([entry1, entry2], 4), 0)
+        compare(history.count_protests([entry1, entry2], -1), 0)
+        compare(history.count_protests(['spanner', entry1], 1), 1)
+
+        # Entries outside the index have no history
+        entry4 = TournamentEntry('entry4', 'foo', game_history=[1])
+        compare(history.count_protests([entry4], 1), 0)
+        compare(Table(1, [entry4]).protest_score(), 1)
+        compare(Table(1, [entry4]).protest_score(history), 0)
+
+        # More tables than there is history for
+        compare(history.get_protests([[entry1, entry2], [entry3, BYE]], 5).\
+            tolist(), [[1, 1, 2, 0, 0], [0, 0, 0, 0, 0]])
+        compare(TableHistory().get_protests([[BYE, BYE]]).tolist(), [[0]])
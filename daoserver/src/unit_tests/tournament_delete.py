@@ -0,0 +1,79 @@
+"""
+Test deleting a tournament and everything in it
+"""
+
+from testfixtures import compare
+
+from models.dao.game_entry import GameEntrant
+from models.dao.permissions import ProtectedObject
+from models.dao.score import GameScore, ScoreCategory, Standing, \
+TournamentScore
+from models.dao.table_allocation import TableAllocation
+from models.dao.tournament import Tournament as TournamentDAO
+from models.dao.tournament_entry import TournamentEntry
+from models.dao.tournament_game import TournamentGame
+from models.dao.tournament_round import TournamentRound
+from models.score import Score
+from models.tournament import Tournament
+from unit_tests.app_simulating_test import AppSimulatingTest
+from unit_tests.tournament_injector import score_cat_args as cat
+
+# pylint: disable=no-member,missing-docstring
+class DeleteTournament(AppSimulatingTest):
+
+    tourn_1 = 'delete_tournament_small'
+    tourn_2 = 'delete_tournament_large'
+
+    def inject(self, name, num_players):
+        self.injector.inject(name, num_players=num_players)
+        tourn = Tournament(name)
+        tourn.update({'rounds': 3, 'score_categories': [
+            cat('battle', 80, False, 0, 20),
+            cat('painting', 20, True, 0, 10)]})
+
+        for entry in tourn.get_entries():
+            game = GameEntrant.query.filter_by(entrant_id=entry.id).first()
+            Score(tournament=tourn, entry_id=entry.id, game_id=game.game_id,
+                  category='battle', score=10).write()
+            Score(tournament=tourn, entry_id=entry.id, category='painting',
+                  score=5).write()
+        return tourn
+
+    def remaining(self, name):
+        """The number of rows left behind for the tournament"""
+        entries = self.db.session.query(TournamentEntry.id).\
+            filter_by(tournament_id=name)
+        games = self.db.session.query(TournamentGame.id).\
+            join(TournamentRound).filter_by(tournament_name=name)
+        return [x.count() for x in [
+            TournamentDAO.query.filter_by(name=name),
+            TournamentRound.query.filter_by(tournament_name=name),
+            TournamentGame.query.filter(TournamentGame.id.in_(games)),
+            GameEntrant.query.filter(GameEntrant.entrant_id.in_(entries)),
+            GameScore.query.filter(GameScore.entry_id.in_(entries)),
+            TournamentScore.query.filter(
+                TournamentScore.entry_id.in_(entries)),
+            Standing.query.filter(Standing.entry_id.in_(entries)),
+            TableAllocation.query.filter(
+                TableAllocation.entry_id.in_(entries)),
+            ScoreCategory.query.filter_by(tournament_id=name),
+            entries]]
+
+    def delete(self, tourn):
+        with self.record_statements() as statements:
+            tourn.delete()
+        return len(statements)
+
+    def test_delete(self):
+        small = self.inject(self.tourn_1, 3)
+        large = self.inject(self.tourn_2, 8)
+        self.assertTrue(all(self.remaining(self.tourn_2)))
+        prot_obj_id = large.get_dao().protected_object_id
+        game_prot_obj_id = TournamentGame.query.join(TournamentRound).\
+            filter_by(tournament_name=self.tourn_2).first().protected_object_id
+
+        compare(self.delete(small), self.delete(large))
+        for name in [self.tourn_1, self.tourn_2]:
+            compare(self.remaining(name), [0] * 10)
+        compare(ProtectedObject.query.filter(ProtectedObject.id.in_(
+            [prot_obj_id, game_prot_obj_id])).count(), 0)
@@ -0,0 +1,87 @@
+"""
+Test exporting the results of a tournament
+"""
+
+import csv
+import json
+
+from testfixtures import compare
+
+from models.dao.game_entry import GameEntrant
+from models.score import Score
+from models.tournament import RESULT_FIELDS, Tournament
+from unit_tests.app_simulating_test import AppSimulatingTest
+from unit_tests.tournament_injector import score_cat_args as cat
+
+# pylint: disable=no-member,missing-docstring
+class ExportResults(AppSimulatingTest):
+
+    tourn_1 = 'export_results'
+
+    def setUp(self):
+        super(ExportResults, self).setUp()
+        self.injector.inject(self.tourn_1, num_players=3)
+        tourn = Tournament(self.tourn_1)
+        tourn.update({'rounds': 1, 'score_categories': [
+            cat('battle', 80, False, 0, 20),
+            cat('painting', 20, True, 0, 10)]})
+
+        # One pair plays and the other entry has the BYE
+        entries = tourn.get_entries()
+        game = GameEntrant.query.filter_by(entrant_id=entries[0].id).first().\
+            game
+        players = sorted(x.entrant_id for x in game.entrants)
+        self.game = [x for x in entries if x.id in players] + [game]
+        self.bye = [x for x in entries if x.id not in players][0]
+        Score(tournament=tourn, entry_id=self.game[0].id, game_id=game.id,
+              category='battle', score=15).write()
+        Score(tournament=tourn, entry_id=self.bye.id, category='painting',
+              score=7).write()
+
+    def expected(self):
+        entry_1, entry_2, game = self.game
+        bye = GameEntrant.query.filter_by(entrant_id=self.bye.id).first().game
+        # Game rows by entry then the per tournament scores
+        return sorted([
+            [entry_1.player_id, entry_1.id, 1, game.table_num, game.id,
+             entry_2.player_id, 'battle', 15],
+            [entry_2.player_id, entry_2.id, 1, game.table_num, game.id,
+             entry_1.player_id, None, None],
+            [self.bye.player_id, self.bye.id, 1, bye.table_num, bye.id, None,
+             None, None]], key=lambda x: x[1]) + [
+                 [self.bye.player_id, self.bye.id, None, None, None, None,
+                  'painting', 7]]
+
+    def test_export_results(self):
+        expected = self.expected()
+        compare([[x[y] for y in RESULT_FIELDS] for x in \
+            Tournament(self.tourn_1).export_results(batch_size=1)], expected)
+
+        response = self.client.get(
+            '/tournament/{}/export?format=jsonl'.format(self.tourn_1))
+        compare(response.mimetype, 'application/x-ndjson')
+        compare([[json.loads(x)[y] for y in RESULT_FIELDS] for x in \
+            response.data.splitlines()], expected)
+
+        response = self.client.get('/tournament/{}/export'.format(self.tourn_1))
+        compare(response.mimetype, 'text/csv')
+        compare(list(csv.reader(response.data.splitlines())),
+                [RESULT_FIELDS] + [['' if x is None else str(x) for x in y] \
+                    for y in expected])
+
+        response = self.client.get(
+            '/tournament/{}/export?format=xml'.format(self.tourn_1))
+        compare(response.status_code, 400)
+
+    def test_export_filename(self):
+        response = self.client.get('/tournament/{}/export'.format(self.tourn_1))
+        compare(response.headers['Content-Disposition'],
+                'attachment; filename="export_results.csv"')
+
+        name = 'export; results "final"'
+        self.injector.inject(name, num_players=1)
+        response = self.client.get(
+            '/tournament/{}/export?format=jsonl'.format(name))
+        self.assert200(response)
+        compare(response.headers['Content-Disposition'],
+                'attachment; filename="export__results__final_.jsonl"')
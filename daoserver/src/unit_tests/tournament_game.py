@@ -6,6 +6,8 @@ from sqlalchemy.sql.expression import and_
 from testfixtures import compare
 
 from models.dao.game_entry import GameEntrant
+from models.dao.permissions import AccountProtectedObjectPermission, \
+ProtObjPerm
 from models.dao.score import ScoreCategory
 from models.dao.tournament_entry import TournamentEntry
 from models.dao.tournament_game import TournamentGame
@@ -70,22 +72,24 @@ class TestGames(AppSimulatingTest):
 
     def test_no_scores(self):
         """
-        There should be an error when you check a game before score categories \
-        are assigned to it.
+        A game isn't complete before score categories are assigned to it
         """
         entry_1_id = TournamentEntry.query.filter_by(
             player_id='{}_player_{}'.format(self.tourn_1, 1),
             tournament_id=self.tourn_1).first().id
         game = self.get_game_by_round(entry_1_id, 1)
-        self.assertRaises(AttributeError, Score.is_score_entered, game)
+        # Only the game's counters are read, nothing is recounted or written
+        with self.record_statements() as statements:
+            self.assertFalse(Score.is_score_entered(game))
+        compare(statements, [])
 
     def test_score_entered(self):
         tourn = Tournament(self.tourn_1)
 
-        score_args = cat('per_round', 50, False, 0, 100)
-        cat_1 = ScoreCategory(tournament_id=self.tourn_1, **score_args)
-        self.db.session.add(cat_1)
-        self.db.session.flush()
+        tourn.update({'score_categories': [
+            cat('per_round', 50, False, 0, 100)]})
+        cat_1 = ScoreCategory.query.filter_by(tournament_id=self.tourn_1,
+                                              name='per_round').first()
 
         entry_2_id = TournamentEntry.query.filter_by(
             player_id='{}_player_{}'.format(self.tourn_1, 2),
@@ -141,6 +145,47 @@ class TestGames(AppSimulatingTest):
               entry_id=entry_5_id, score=5).write()
         self.assertTrue(Score.is_score_entered(game))
 
+    def test_draw_written(self):
+        """Games, entrants and permissions are written once per draw"""
+        tourn = Tournament(self.tourn_1)
+        for _ in range(2):
+            tourn.get_round(1).make_draw(tourn.get_entries())
+
+            games = tourn.get_round(1).get_dao().games.all()
+            compare(sorted(x.table_num for x in games), [1, 2, 3])
+            compare(sorted(x.entrants.count() for x in games), [1, 2, 2])
+            compare(sorted(x.score_entered for x in games),
+                    [False, False, True])
+
+            perms = AccountProtectedObjectPermission.query.join(ProtObjPerm).\
+                filter(ProtObjPerm.protected_object_id.in_(
+                    [x.protected_object_id for x in games])).all()
+            compare(sorted(x.account_username for x in perms),
+                    ['{}_player_{}'.format(self.tourn_1, x) \
+                    for x in range(1, 6)])
+
+        # A game that lost its permission gets a new one without using up a
+        # game or protected object id
+        perm = ProtObjPerm.query.filter_by(
+            protected_object_id=games[0].protected_object_id)
+        AccountProtectedObjectPermission.query.filter(
+            AccountProtectedObjectPermission.protected_object_permission_id.\
+            in_(perm.with_entities(ProtObjPerm.id))).\
+            delete(synchronize_session=False)
+        perm.delete()
+        sequences = ['game_id_seq', 'protected_object_id_seq',
+                     'protected_object_permission_id_seq']
+        before = [self.last_value(x) for x in sequences]
+        tourn.get_round(1).make_draw(tourn.get_entries())
+        compare([self.last_value(x) for x in sequences],
+                before[:2] + [before[2] + 1])
+        compare(ProtObjPerm.query.filter_by(
+            protected_object_id=games[0].protected_object_id).count(), 1)
+
+    def last_value(self, sequence):
+        return self.db.session.execute(
+            'SELECT last_value FROM {}'.format(sequence)).scalar()
+
     @staticmethod
     def get_game_by_round(entry_id, round_num):
         """Get the game an entry played in during a round"""
@@ -49,11 +49,14 @@ class TournamentInjector(object):
         """Remove all tournaments we have injected"""
 
         for tournament in self.tournaments:
+            # The test may have deleted it already
             dao = tournament.get_dao()
-            dao.in_progress = False
-            db.session.flush()
-            tournament.delete()
-            Account.query.filter_by(username=dao.to_username).delete()
+            if dao is not None:
+                dao.in_progress = False
+                db.session.flush()
+                tournament.delete()
+            Account.query.filter_by(
+                username='{}_creator'.format(tournament.tournament_id)).delete()
             db.session.commit()
         self.tournaments = set()
 
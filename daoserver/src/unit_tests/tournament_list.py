@@ -0,0 +1,84 @@
+"""
+Test listing tournaments
+"""
+
+from datetime import date, datetime
+import json
+
+from testfixtures import compare
+
+from models.tournament import Tournament, list_tournaments
+from unit_tests.app_simulating_test import AppSimulatingTest
+
+# pylint: disable=no-member,missing-docstring
+class ListTournaments(AppSimulatingTest):
+
+    tourn_1 = 'list_tournaments_b'
+    tourn_2 = 'list_tournaments_a'
+    tourn_3 = 'list_tournaments_c'
+    start = date(2101, 1, 1)
+    end = date(2101, 12, 31)
+
+    def setUp(self):
+        super(ListTournaments, self).setUp()
+        self.injector.inject(self.tourn_1, num_players=3,
+                             date=datetime(2101, 3, 1))
+        self.injector.inject(self.tourn_2, num_players=0,
+                             date=datetime(2101, 5, 1))
+        self.injector.inject(self.tourn_3, num_players=1,
+                             date=datetime(2101, 3, 1))
+        Tournament(self.tourn_1).update({'rounds': 2})
+
+    def names(self, **kwargs):
+        return [x['name'] for x in list_tournaments(
+            from_date=self.start, to_date=self.end, **kwargs)]
+
+    def test_list_tournaments(self):
+        with self.record_statements() as statements:
+            listed = list_tournaments(
+                username='{}_player_2'.format(self.tourn_1),
+                from_date=self.start, to_date=self.end)
+        compare(len(statements), 1)
+        compare(listed, [
+            {'name': self.tourn_2, 'date': date(2101, 5, 1), 'rounds': 0,
+             'entries': 0, 'user_entered': False},
+            {'name': self.tourn_1, 'date': date(2101, 3, 1), 'rounds': 2,
+             'entries': 3, 'user_entered': True},
+            {'name': self.tourn_3, 'date': date(2101, 3, 1), 'rounds': 0,
+             'entries': 1, 'user_entered': False}])
+
+        # Dates
+        compare(self.names(order='date'),
+                [self.tourn_1, self.tourn_3, self.tourn_2])
+        compare([x['name'] for x in list_tournaments(
+            from_date=date(2101, 4, 1), to_date=self.end)],
+                [self.tourn_2])
+        compare([x['name'] for x in list_tournaments(
+            from_date=self.start, to_date=date(2101, 3, 1))],
+                [self.tourn_1, self.tourn_3])
+
+        # Pages
+        compare(self.names(limit=2), [self.tourn_2, self.tourn_1])
+        compare(self.names(limit=2, after=[self.tourn_1]), [self.tourn_3])
+        compare(self.names(order='date', limit=1,
+                           after=[date(2101, 3, 1), self.tourn_1]),
+                [self.tourn_3])
+        compare(self.names(order='date',
+                           after=[date(2101, 3, 1), self.tourn_3]),
+                [self.tourn_2])
+        self.assertRaises(ValueError, list_tournaments, order='rounds')
+
+    def test_list_endpoint(self):
+        response = self.client.get(
+            '/tournament/?from_date=2101-01-01&to_date=2101-12-31'
+            '&order=date&after_date=2101-03-01&after_name={}'.format(
+                self.tourn_1))
+        self.assert200(response)
+        compare([x['name'] for x in json.loads(response.data)['tournaments']],
+                [self.tourn_3, self.tourn_2])
+
+        response = self.client.get('/tournament/?from_date=01/01/2101')
+        self.assert400(response)
+        response = self.client.get(
+            '/tournament/?order=date&after_name={}'.format(self.tourn_1))
+        self.assert400(response)
@@ -3,8 +3,12 @@ Setting the number of rounds in a tournament
 """
 from testfixtures import compare
 
+from models.dao.game_entry import GameEntrant
+from models.dao.permissions import ProtObjPerm
+from models.dao.tournament_game import TournamentGame
 from models.dao.tournament_round import TournamentRound
 from models.tournament import Tournament
+from models.tournament_round import get_table_history
 
 from unit_tests.app_simulating_test import AppSimulatingTest
 
@@ -93,3 +97,94 @@ class SetRounds(AppSimulatingTest):
         self.assertRaises(ValueError, tourn._set_rounds, '')
         self.assertRaises(ValueError, tourn.update, {'rounds': ''})
         self.assertRaises(TypeError, tourn._set_rounds, None)
+
+    def test_get_draw(self):
+        """The draw is read from the db and cached until it changes"""
+        name = 'test_get_draw'
+        self.injector.inject(name, num_players=5)
+        tourn = Tournament(name)
+        tourn.update({'rounds': 1})
+
+        rnd = tourn.get_round(1)
+        draw = rnd.get_draw()
+        compare(draw, [
+            {'table_number': 1,
+             'entrants': ['test_get_draw_player_1', 'test_get_draw_player_5']},
+            {'table_number': 2,
+             'entrants': ['test_get_draw_player_2', 'test_get_draw_player_4']},
+            {'table_number': 3,
+             'entrants': ['test_get_draw_player_3', 'BYE']}])
+        self.assertTrue(tourn.get_round(1).get_draw() is draw)
+
+        version = rnd.get_dao().draw_version
+        rnd.make_draw(tourn.get_entries())
+        compare(rnd.get_dao().draw_version, version)
+        self.assertTrue(tourn.get_round(1).get_draw() is draw)
+
+        rnd.destroy_draw()
+        compare(rnd.get_dao().draw_version, version + 1)
+        compare(tourn.get_round(1).get_draw(), [])
+
+        rnd.make_draw(tourn.get_entries())
+        compare(rnd.get_dao().draw_version, version + 2)
+        compare(tourn.get_round(1).get_draw(), draw)
+
+    def test_table_history(self):
+        """Drawing records table allocations that later rounds avoid"""
+        name = 'test_table_history'
+        self.injector.inject(name, num_players=6)
+        tourn = Tournament(name)
+        tourn.update({'rounds': 2})
+
+        entries = tourn.get_entries()
+        history = get_table_history(name)
+        compare(sorted(history.keys()), sorted(x.id for x in entries))
+        for entry in entries:
+            compare(entry.game_history, history[entry.id])
+            compare(len(history[entry.id]), 2)
+            # Nobody needs to play on the same table twice
+            compare(len(set(history[entry.id])), 2)
+
+        compare(get_table_history(name, before_round=2),
+                {x: y[:1] for x, y in history.items()})
+
+        tourn.get_round(2).destroy_draw()
+        compare(get_table_history(name),
+                {x: y[:1] for x, y in history.items()})
+
+        tourn.update({'rounds': 1})
+        tourn.get_round(1).destroy_draw()
+        compare(get_table_history(name), {})
+
+    def test_redraw_statements(self):
+        """
+        Redrawing every round costs the same however many entries or rounds
+        """
+        counts = []
+        for size, rounds in [(8, 2), (24, 6)]:
+            name = 'test_redraw_statements_{}'.format(size)
+            self.injector.inject(name, num_players=size)
+            tourn = Tournament(name)
+            tourn.update({'rounds': rounds})
+            game_id, prot_obj_id = self.db.session.query(
+                TournamentGame.id, TournamentGame.protected_object_id).\
+                join(TournamentRound).\
+                filter_by(tournament_name=name, ordering=1).first()
+            history = get_table_history(name)
+
+            with self.record_statements() as statements:
+                tourn.make_draws()
+            counts.append(len(statements))
+            # One INSERT per table for all the rounds
+            compare(len([x for x in statements if x.startswith('INSERT')]), 6)
+
+            # The old games and their permissions are all gone
+            compare(TournamentGame.query.filter_by(id=game_id).count(), 0)
+            compare(ProtObjPerm.query.filter_by(
+                protected_object_id=prot_obj_id).count(), 0)
+            compare(GameEntrant.query.join(TournamentGame).\
+                join(TournamentRound).filter_by(tournament_name=name).count(),
+                    size * rounds)
+            # The same draw is made from the history as just drawn
+            compare(get_table_history(name), history)
+        compare(counts[0], counts[1])
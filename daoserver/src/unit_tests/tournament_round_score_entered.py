@@ -71,24 +71,22 @@ class TestScoreEntered(AppSimulatingTest):
 
     def test_no_scores(self):
         """
-        There should be an error when you check a game before score categories \
-        are assigned to it.
+        A game isn't complete before score categories are assigned to it
         """
         entry_1_id = TournamentEntry.query.filter_by(
             player_id='{}_player_{}'.format(self.tournament_1, 1),
             tournament_id=self.tournament_1).first().id
         game = self.get_game_by_round(entry_1_id, 1)
-        self.assertRaises(AttributeError, Score.is_score_entered, game)
+        self.assertFalse(Score.is_score_entered(game))
 
 
     def test_score_entered(self):
         # Add a score category
-        args = score_cat_args('per_round', 50, False, 0, 100)
-        category_1 = ScoreCategory(tournament_id=self.tournament_1, **args)
-        self.db.session.add(category_1)
-        self.db.session.flush()
-
         tourn = Tournament(self.tournament_1)
+        tourn.update({'score_categories': [
+            score_cat_args('per_round', 50, False, 0, 100)]})
+        category_1 = ScoreCategory.query.filter_by(
+            tournament_id=self.tournament_1, name='per_round').first()
 
         entry_2_id = TournamentEntry.query.filter_by(
             player_id='{}_player_{}'.format(self.tournament_1, 2),
@@ -144,6 +142,57 @@ class TestScoreEntered(AppSimulatingTest):
               entry_id=entry_5_id, score=5).write()
         self.assertTrue(Score.is_score_entered(game))
 
+    def test_score_counters(self):
+        """Games count the scores they expect and receive as they are written"""
+        tourn = Tournament(self.tournament_1)
+        tourn.update({'score_categories': [
+            score_cat_args('battle', 80, False, 0, 20),
+            score_cat_args('sports', 10, False, 1, 5),
+            score_cat_args('painting', 10, True, 1, 5)]})
+        entry_4_id = TournamentEntry.query.filter_by(
+            player_id='{}_player_{}'.format(self.tournament_1, 4),
+            tournament_id=self.tournament_1).first().id
+        game = self.get_game_by_round(entry_4_id, 1)
+        compare((game.scores_expected, game.scores_received), (4, 0))
+
+        entrants = [x.entrant_id for x in game.entrants]
+        for i, (entrant, category) in enumerate([
+                (entrants[0], 'battle'), (entrants[0], 'sports'),
+                (entrants[1], 'battle'), (entrants[1], 'sports')]):
+            self.assertFalse(Score.is_score_entered(game))
+            Score(category=category, game_id=game.id, tournament=tourn,
+                  entry_id=entrant, score=i + 1).write()
+            compare(game.scores_received, i + 1)
+        self.assertTrue(game.score_entered)
+
+        # Redrawing counts the new games
+        tourn.make_draws()
+        compare(sorted((x.entrants.count(), x.scores_expected) \
+            for x in tourn.get_round(2).get_dao().games),
+                [(1, 2), (2, 4), (2, 4)])
+
+    def test_redraw(self):
+        """A round with scores keeps its draw when the others are redrawn"""
+        tourn = Tournament(self.tournament_1)
+        entry_4_id = TournamentEntry.query.filter_by(
+            player_id='{}_player_{}'.format(self.tournament_1, 4),
+            tournament_id=self.tournament_1).first().id
+
+        game = self.get_game_by_round(entry_4_id, 1)
+        game.score_entered = True
+        self.db.session.add(game)
+        self.db.session.commit()
+        round_1 = sorted(x.id for x in tourn.get_round(1).get_dao().games)
+        round_2 = sorted(x.id for x in tourn.get_round(2).get_dao().games)
+
+        tourn.make_draws()
+        compare(sorted(x.id for x in tourn.get_round(1).get_dao().games),
+                round_1)
+        redrawn = tourn.get_round(2).get_dao().games.all()
+        compare(len(redrawn), 3)
+        self.assertFalse(set(x.id for x in redrawn) & set(round_2))
+        compare(sorted(x.entrants.count() for x in redrawn), [1, 2, 2])
+
     @staticmethod
     def get_game_by_round(entry_id, round_num):
         """Get the game an entry played in during a round"""
@@ -4,13 +4,17 @@ Test entering scores for games in a tournament
 
 from testfixtures import compare
 
-from models.dao.score import ScoreCategory
+from models.dao.game_entry import GameEntrant
+from models.dao.score import GameScore, Score as ScoreDAO, ScoreCategory, \
+Standing, TournamentScore
+from models.dao.tournament_game import TournamentGame
+from models.score import CATEGORY_CACHE, Score, get_categories
 from models.tournament import Tournament
 
 from unit_tests.app_simulating_test import AppSimulatingTest
 from unit_tests.tournament_injector import score_cat_args as cat
 
-# pylint: disable=no-member,missing-docstring
+# pylint: disable=no-member,missing-docstring,protected-access
 class ScoreCategoryTests(AppSimulatingTest):
 
     tourn_1 = 'test_score_categories'
@@ -111,3 +115,79 @@ class ScoreCategoryTests(AppSimulatingTest):
         self.assertRaises(ValueError, func, {'score_categories': [none_name]})
         self.assertRaises(ValueError, func,
                           {'score_categories': [fifty_one, fifty_one]})
+
+    def test_category_cache(self):
+        self.tournament.update({'score_categories': [self.cat_1, self.cat_2]})
+        cached = get_categories(self.tournament.get_dao())
+        compare(sorted(cached.by_name.keys()), ['cat_battle', 'painting'])
+        compare(cached.by_id[cached.by_name['painting'].id].percentage, 10)
+        self.assertTrue(get_categories(self.tournament.get_dao()) is cached)
+        self.assertTrue(
+            self.tournament.get_score_categories()[0] in cached.categories)
+
+        # Changing the categories replaces them, even when categories read
+        # before the change are cached afterwards, e.g. by another request
+        self.tournament.update({'score_categories': [self.cat_1, self.cat_3]})
+        CATEGORY_CACHE[self.tourn_1] = cached
+        compare(sorted(x['name'] for x in \
+            self.tournament.get_score_categories(serialized=True)),
+                ['cat_sports', 'painting'])
+        cached = get_categories(self.tournament.get_dao())
+        self.tournament.update({'score_categories': [self.cat_1, self.cat_3]})
+        self.assertTrue(get_categories(self.tournament.get_dao()) is cached)
+
+        # As does a new tournament with the same name
+        self.injector.delete()
+        self.injector.inject(self.tourn_1)
+        compare(self.tournament.get_score_categories(), [])
+
+    def test_replace_categories(self):
+        self.tournament.update({'rounds': 1, 'score_categories': [
+            self.cat_1, self.cat_2, self.cat_3]})
+        for entry in self.tournament.get_entries():
+            game = GameEntrant.query.filter_by(entrant_id=entry.id).first()
+            Score(tournament=self.tournament, entry_id=entry.id,
+                  game_id=game.game_id, category='painting', score=5).write()
+            Score(tournament=self.tournament, entry_id=entry.id,
+                  category='cat_battle', score=10).write()
+        painting = ScoreCategory.query.filter_by(
+            tournament_id=self.tourn_1, name='painting').first().id
+
+        # Nothing has changed so nothing is written
+        with self.record_statements() as statements:
+            self.tournament._set_score_categories(
+                [self.cat_1, self.cat_2, self.cat_3])
+        compare([x for x in statements if not x.startswith('SELECT')], [])
+
+        # Swapping percentages is fine in any order, and the scores of the
+        # category removed go with a DELETE per table
+        with self.record_statements() as statements:
+            self.tournament._set_score_categories([
+                cat('cat_sports', 90, True, 1, 5),
+                cat('cat_battle', 10, True, 1, 20)])
+        compare(len([x for x in statements if x.startswith('DELETE')]), 5)
+
+        compare(ScoreDAO.query.filter_by(score_category_id=painting).count(),
+                0)
+        compare(Standing.query.filter_by(score_category_id=painting).count(),
+                0)
+        compare(GameScore.query.join(TournamentGame).join(GameEntrant).\
+            filter(GameEntrant.entrant_id.in_(
+                [x.id for x in self.tournament.get_entries()])).count(), 0)
+        compare(TournamentScore.query.filter_by(
+            tournament_id=self.tournament.get_dao().id).count(), 6)
+        compare(set(x.scores_expected for x in TournamentGame.query.\
+            join(GameEntrant).filter(GameEntrant.entrant_id.in_(
+                [x.id for x in self.tournament.get_entries()]))), set([0]))
+        compare(sorted((x.name, x.percentage) for x in \
+            self.tournament.get_score_categories()),
+                [('cat_battle', 10), ('cat_sports', 90)])
+
+        # Too much in total and nothing changes
+        self.assertRaises(
+            ValueError, self.tournament._set_score_categories,
+            [cat('cat_battle', 20, True, 1, 20),
+             cat('cat_sports', 90, True, 1, 5)])
+        compare(sorted((x.name, x.percentage) for x in \
+            self.tournament.get_score_categories()),
+                [('cat_battle', 10), ('cat_sports', 90)])
@@ -0,0 +1,107 @@
+"""
+Maximum weight matching unit tests
+"""
+# pylint: disable=invalid-name,missing-docstring
+
+import itertools
+import random
+import unittest
+
+from testfixtures import compare
+
+from models.weighted_matching import max_weight_matching
+
+def best_weight(num_vertices, edges, max_cardinality):
+    """Total weight of the best matching found by trying all of them"""
+    weights = {}
+    for i, j, weight in edges:
+        weights[(i, j)] = weights[(j, i)] = weight
+
+    def matchings(free):
+        if not free:
+            yield (0, 0)
+            return
+        rest = free[1:]
+        for result in matchings(rest):
+            yield result
+        for other in rest:
+            if (free[0], other) in weights:
+                for size, total in matchings([x for x in rest if x != other]):
+                    yield (size + 1, total + weights[(free[0], other)])
+
+    results = list(matchings(list(range(num_vertices))))
+    if max_cardinality:
+        most = max(size for size, _ in results)
+        results = [x for x in results if x[0] == most]
+    return max(total for _, total in results)
+
+class WeightedMatchingTests(unittest.TestCase):
+    """Tests for `weighted_matching.py`."""
+
+    def test_simple(self):
+        compare(max_weight_matching([]), [])
+        compare(max_weight_matching([(0, 1, 1)]), [1, 0])
+        compare(max_weight_matching([(1, 2, 10), (2, 3, 11)]),
+                [-1, -1, 3, 2])
+        compare(max_weight_matching([(1, 2, 5), (2, 3, 11), (3, 4, 5)]),
+                [-1, -1, 3, 2, -1])
+        compare(max_weight_matching([(1, 2, 5), (2, 3, 11), (3, 4, 5)],
+                                    max_cardinality=True),
+                [-1, 2, 1, 4, 3])
+        # Negative weights are only used for cardinality
+        compare(max_weight_matching([(1, 2, 2), (1, 3, -2), (2, 3, 1),
+                                     (2, 4, -1), (3, 4, -6)]),
+                [-1, 2, 1, -1, -1])
+        compare(max_weight_matching([(1, 2, 2), (1, 3, -2), (2, 3, 1),
+                                     (2, 4, -1), (3, 4, -6)], True),
+                [-1, 3, 4, 1, 2])
+
+    def test_blossoms(self):
+        # S-blossom and use it for augmentation
+        compare(max_weight_matching([(1, 2, 8), (1, 3, 9), (2, 3, 10),
+                                     (3, 4, 7), (1, 6, 5), (4, 5, 6)]),
+                [-1, 6, 3, 2, 5, 4, 1])
+        # T-blossom expanded mid stage
+        compare(max_weight_matching([(1, 2, 23), (1, 5, 22), (1, 6, 15),
+                                     (2, 3, 25), (3, 4, 22), (4, 5, 25),
+                                     (4, 8, 14), (5, 7, 13)]),
+                [-1, 6, 3, 2, 8, 7, 1, 5, 4])
+        # Nested S-blossom relabelled as T and expanded
+        compare(max_weight_matching([(1, 2, 19), (1, 3, 20), (1, 8, 8),
+                                     (2, 3, 25), (2, 4, 18), (3, 5, 18),
+                                     (4, 5, 13), (4, 7, 7), (5, 6, 7)]),
+                [-1, 8, 3, 2, 7, 6, 5, 4, 1])
+
+    def test_matches_exhaustive(self):
+        rand = random.Random(0)
+        for _ in range(300):
+            num_vertices = rand.randint(2, 8)
+            edges = [(i, j, rand.randint(-5, 20)) for i, j in \
+                itertools.combinations(range(num_vertices), 2) \
+                if rand.random() < 0.6]
+            if not edges:
+                continue
+            for max_cardinality in (False, True):
+                mates = max_weight_matching(edges, max_cardinality)
+                weights = dict(((i, j), w) for i, j, w in edges)
+                for i, j in enumerate(mates):
+                    if j >= 0:
+                        compare(mates[j], i)
+                total = sum(weights[(i, j)] for i, j in enumerate(mates) \
+                    if i < j)
+                compare(total, best_weight(
+                    len(mates), edges, max_cardinality))
+
+    def test_large(self):
+        """A dense graph of 256 vertices is matched optimally"""
+        rand = random.Random(0)
+        seeds = list(range(256))
+        rand.shuffle(seeds)
+        edges = [(i, j, 70000 - (seeds[i] - seeds[j]) ** 2) \
+            for i, j in itertools.combinations(range(256), 2)]
+
+        mates = max_weight_matching(edges, max_cardinality=True)
+        self.assertTrue(-1 not in mates)
+        # The best matching pairs each seed with the next one
+        compare(sorted(abs(seeds[i] - seeds[j]) for i, j in enumerate(mates)),
+                [1] * 256)
@@ -84,6 +84,15 @@ DECLARE
 BEGIN
     INSERT INTO score VALUES(DEFAULT, ent_id, category, score) RETURNING id INTO score_id;
     INSERT INTO game_score VALUES(ent_id, game_id, score_id);
+    UPDATE game SET scores_received = scores_received + 1,
+        score_entered = score_entered OR (scores_expected > 0 AND scores_received + 1 >= scores_expected)
+        WHERE id = enter_score.game_id;
+
+    UPDATE standing SET score = standing.score + enter_score.score, num_scores = num_scores + 1
+        WHERE entry_id = ent_id AND score_category_id = category;
+    IF NOT FOUND THEN
+        INSERT INTO standing VALUES(ent_id, category, enter_score.score, 1);
+    END IF;
 
     RETURN 0;
 END $$;
@@ -96,6 +105,7 @@ DECLARE
     game_id int := 0;
     perm_id int := 0;
     bye boolean := true;
+    num_entrants int := 0;
 BEGIN
 
     IF ent_1_id IS NOT NULL AND ent_1_uname IS NOT NULL AND ent_2_id IS NOT NULL AND ent_2_uname IS NOT NULL THEN
@@ -109,13 +119,21 @@ BEGIN
     IF ent_1_id IS NOT NULL AND ent_1_uname IS NOT NULL THEN
         INSERT INTO game_entrant VALUES(game_id, ent_1_id);
         INSERT INTO account_protected_object_permission VALUES (ent_1_uname, perm_id);
+        num_entrants = num_entrants + 1;
     END IF;
 
     IF ent_2_id IS NOT NULL AND ent_2_uname IS NOT NULL THEN
         INSERT INTO game_entrant VALUES(game_id, ent_2_id);
         INSERT INTO account_protected_object_permission VALUES (ent_2_uname, perm_id);
+        num_entrants = num_entrants + 1;
     END IF;
 
+    UPDATE game SET scores_expected = num_entrants * (
+        SELECT count(*) FROM score_category sc
+        JOIN tournament_round tr ON tr.tournament_name = sc.tournament_id
+        WHERE tr.id = round_id AND NOT sc.per_tournament)
+        WHERE id = game_id;
+
     RETURN game_id;
 END $$;
 
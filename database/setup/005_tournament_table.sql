@@ -4,5 +4,7 @@ CREATE TABLE tournament(
     date                DATE NOT NULL,
     protected_object_id INTEGER NOT NULL REFERENCES protected_object(id),
     to_username         VARCHAR NOT NULL REFERENCES account(username),
-    in_progress         BOOLEAN NOT NULL DEFAULT FALSE
+    in_progress         BOOLEAN NOT NULL DEFAULT FALSE,
+    category_version    INTEGER NOT NULL DEFAULT 0
 );
+COMMENT ON COLUMN tournament.category_version IS 'Incremented whenever the score categories change so cached categories can be checked.';
@@ -6,6 +6,8 @@ CREATE TABLE tournament_round(
     tournament_name     VARCHAR REFERENCES tournament(name),
     ordering            INTEGER DEFAULT 1,
     mission             VARCHAR,
+    draw_version        INTEGER NOT NULL DEFAULT 0,
     PRIMARY KEY(tournament_name, ordering)
 );
 COMMENT ON TABLE tournament_round IS 'The higher the order number the later the round.';
+COMMENT ON COLUMN tournament_round.draw_version IS 'Incremented whenever the games for the round change so cached draws can be checked.';
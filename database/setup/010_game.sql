@@ -4,8 +4,12 @@ create table game(
     table_num           integer,
     protected_object_id integer references protected_object(id),
     score_entered       boolean DEFAULT False,
+    scores_expected     integer NOT NULL DEFAULT 0,
+    scores_received     integer NOT NULL DEFAULT 0,
     PRIMARY KEY (tournament_round_id, table_num)
 );
+COMMENT ON COLUMN game.scores_expected IS 'Per game score categories x entrants. 0 until counted.';
+COMMENT ON COLUMN game.scores_received IS 'Incremented as each game_score is written.';
 
 CREATE TABLE game_entrant(
     game_id INTEGER REFERENCES game(id),
@@ -0,0 +1,10 @@
+-- Running totals of each entry's scores, kept up to date as scores are
+-- entered, so rankings don't need to revisit every score.
+CREATE TABLE standing(
+    entry_id            INTEGER REFERENCES entry(id),
+    score_category_id   INTEGER REFERENCES score_category(id),
+    score               INTEGER NOT NULL DEFAULT 0,
+    num_scores          INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY(entry_id, score_category_id)
+);
+COMMENT ON TABLE standing IS 'The sum and count of the scores an entry has in a score_category. Maintained by Score.write';